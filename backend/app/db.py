@@ -0,0 +1,171 @@
+"""
+Direct Postgres access via asyncpg for aggregate queries
+Used when DATABASE_POOLER_URL or DATABASE_URL is configured; otherwise callers fall back to PostgREST
+"""
+import logging
+from typing import Optional, List, Dict, Any
+
+import asyncpg
+
+from app.utils import get_settings
+
+logger = logging.getLogger(__name__)
+
+# Connection pool, created on app startup when DATABASE_URL is set
+_pool: Optional[asyncpg.Pool] = None
+
+# Idle pooled connections are closed after this long, in seconds
+POOL_IDLE_TIMEOUT = 30
+
+
+ADMIN_STATS_SQL = """
+SELECT
+    (SELECT COUNT(DISTINCT user_id) FROM chats) AS total_users,
+    (SELECT COUNT(*) FROM chats) AS total_chats,
+    (SELECT COUNT(*) FROM messages) AS total_messages,
+    (SELECT COUNT(*) FROM files) AS total_files
+"""
+
+RECENT_CHATS_SQL = """
+SELECT id::text, user_id::text, title, created_at
+FROM chats
+ORDER BY created_at DESC
+LIMIT 10
+"""
+
+USER_STATS_SQL = """
+WITH chat_counts AS (
+    SELECT user_id, COUNT(*) AS chat_count, MIN(created_at) AS first_chat_at
+    FROM chats
+    GROUP BY user_id
+),
+file_counts AS (
+    SELECT user_id, COUNT(*) AS file_count
+    FROM files
+    GROUP BY user_id
+)
+SELECT
+    c.user_id::text AS id,
+    u.email,
+    COALESCE(u.created_at, c.first_chat_at) AS created_at,
+    u.last_sign_in_at,
+    c.chat_count,
+    COALESCE(f.file_count, 0) AS file_count
+FROM chat_counts c
+LEFT JOIN file_counts f USING (user_id)
+LEFT JOIN auth.users u ON u.id = c.user_id
+"""
+
+
+async def init_pool() -> Optional[asyncpg.Pool]:
+    """
+    Create the connection pool if DATABASE_POOLER_URL or DATABASE_URL is configured
+
+    The pooler is preferred. In transaction mode consecutive statements can
+    land on different server connections, so asyncpg's prepared statement
+    cache is disabled for it.
+    """
+    global _pool
+    settings = get_settings()
+    dsn = settings.database_pooler_url or settings.database_url
+    if _pool is None and dsn:
+        _pool = await asyncpg.create_pool(
+            dsn,
+            min_size=2,
+            max_size=20,
+            max_inactive_connection_lifetime=POOL_IDLE_TIMEOUT,
+            statement_cache_size=0 if settings.database_pooler_url else 100
+        )
+        logger.info("✅ Postgres connection pool created (%s)", "pooler" if settings.database_pooler_url else "direct")
+    return _pool
+
+
+async def close_pool() -> None:
+    """Close the connection pool"""
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+
+
+def get_pool() -> Optional[asyncpg.Pool]:
+    """Get the connection pool, or None when direct SQL is not configured"""
+    return _pool
+
+
+async def fetch_admin_stats() -> Dict[str, Any]:
+    """Get admin overview statistics with SQL aggregates"""
+    async with _pool.acquire() as conn:
+        totals = await conn.fetchrow(ADMIN_STATS_SQL)
+        recent_chats = await conn.fetch(RECENT_CHATS_SQL)
+
+    return {
+        **dict(totals),
+        "recent_activity": [dict(row) for row in recent_chats]
+    }
+
+
+async def fetch_user_stats() -> List[Dict[str, Any]]:
+    """Get every user with chats, joined with auth info and chat/file counts"""
+    async with _pool.acquire() as conn:
+        rows = await conn.fetch(USER_STATS_SQL)
+
+    users = []
+    for row in rows:
+        user = dict(row)
+        if user["email"] is None:
+            # No auth record - keep the same placeholder as the PostgREST path
+            user["email"] = f"User {user['id'][:8]}..."
+        users.append(user)
+    return users
+
+
+async def append_message_content(message_id: str, text: str) -> None:
+    """Append text to a message in place, without re-sending what's stored"""
+    async with _pool.acquire() as conn:
+        await conn.execute(
+            "UPDATE messages SET content = content || $1 WHERE id = $2::uuid",
+            text,
+            message_id
+        )
+
+
+def _deleted_file(row: asyncpg.Record) -> Dict[str, Any]:
+    """Deleted-file row as a dict with a string file_id"""
+    return {**dict(row), "file_id": str(row["file_id"])}
+
+
+# The delete functions are selected with * so rows carry the bucket column
+# once migrations/010_files_bucket.sql has run, and still work before it
+
+
+async def delete_chat_cascade(chat_id: str, user_id: str) -> List[Dict[str, Any]]:
+    """Delete a chat and everything linked to it via the delete_chat_cascade function"""
+    async with _pool.acquire() as conn:
+        rows = await conn.fetch(
+            "SELECT * FROM delete_chat_cascade($1::uuid, $2::uuid)",
+            chat_id,
+            user_id
+        )
+    return [_deleted_file(row) for row in rows]
+
+
+async def delete_user_cascade(user_id: str) -> List[Dict[str, Any]]:
+    """Delete a user's app data via the delete_user_cascade function"""
+    async with _pool.acquire() as conn:
+        rows = await conn.fetch(
+            "SELECT * FROM delete_user_cascade($1::uuid)",
+            user_id
+        )
+    return [_deleted_file(row) for row in rows]
+
+
+async def delete_file_owned(file_id: str, user_id: str) -> Optional[Dict[str, Any]]:
+    """Delete an owned file record and its chunks via the delete_file_owned function"""
+    async with _pool.acquire() as conn:
+        row = await conn.fetchrow(
+            "SELECT * FROM delete_file_owned($1::uuid, $2::uuid)",
+            file_id,
+            user_id
+        )
+    return dict(row) if row else None
@@ -1,14 +1,210 @@
 """
 Document ingestion using OpenAI File Extraction API
 """
-import io
-from datetime import datetime
-from typing import Dict, Any, List, Optional
+import asyncio
+import logging
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional, Tuple
 
-from openai import AsyncOpenAI
+from cachetools import TTLCache
 
 from app.supabase_client import get_supabase_client
-from app.utils import get_settings
+from app.utils import SETTINGS
+
+logger = logging.getLogger(__name__)
+
+try:
+    import fitz  # PyMuPDF
+except ImportError:
+    fitz = None
+
+# Target size of stored file chunks, in characters
+CHUNK_SIZE = 2000
+
+# Assembled document context keyed by (sorted file IDs, max_chars).
+# Invalidation only reaches this process, so entries live a few seconds: a
+# file deleted or re-ingested via another worker/instance can be sent to the
+# LLM for at most that long, which is accepted.
+CONTEXT_CACHE_TTL = 5
+_context_cache: TTLCache = TTLCache(maxsize=256, ttl=CONTEXT_CACHE_TTL)
+
+# Cache keys sharded by file ID, so invalidation only touches affected
+# entries. Entries are re-set on every add, so they outlive the keys they hold.
+_context_keys_by_file: TTLCache = TTLCache(maxsize=4096, ttl=CONTEXT_CACHE_TTL)
+
+
+def split_text(text: str, chunk_size: int = CHUNK_SIZE) -> List[Tuple[int, str]]:
+    """
+    Split text into chunks of at most chunk_size characters
+    
+    Paragraphs are packed together until the next one would overflow;
+    paragraphs longer than chunk_size are hard-split.
+    
+    Returns:
+        List of (start_offset, chunk_text) tuples
+    """
+    chunks = []
+    current = []
+    current_len = 0
+    current_start = 0
+    offset = 0
+    
+    for paragraph in text.split("\n\n"):
+        para_start = offset
+        offset += len(paragraph) + 2
+        
+        while len(paragraph) > chunk_size:
+            if current:
+                chunks.append((current_start, "\n\n".join(current)))
+                current, current_len = [], 0
+            chunks.append((para_start, paragraph[:chunk_size]))
+            paragraph = paragraph[chunk_size:]
+            para_start += chunk_size
+        
+        if not paragraph:
+            continue
+        
+        if current and current_len + len(paragraph) + 2 > chunk_size:
+            chunks.append((current_start, "\n\n".join(current)))
+            current, current_len = [], 0
+        
+        if not current:
+            current_start = para_start
+        current.append(paragraph)
+        current_len += len(paragraph) + (2 if current_len else 0)
+    
+    if current:
+        chunks.append((current_start, "\n\n".join(current)))
+    
+    return chunks
+
+
+# Pages with less extracted text than this that also carry images are
+# treated as scans/cover images and left out of the stored text
+MIN_PAGE_TEXT_CHARS = 10
+
+# PyMuPDF is not thread-safe and holds the GIL, so PDFs are parsed in worker
+# processes. The pool is shared by concurrent ingests and created on first use.
+PDF_EXTRACT_WORKERS = os.cpu_count() or 1
+_pdf_pool: Optional[ProcessPoolExecutor] = None
+
+
+def get_pdf_pool() -> ProcessPoolExecutor:
+    """Get the process pool used for PDF text extraction"""
+    global _pdf_pool
+    if _pdf_pool is None:
+        # spawn, not fork: the server process has running threads
+        _pdf_pool = ProcessPoolExecutor(
+            max_workers=PDF_EXTRACT_WORKERS,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    return _pdf_pool
+
+
+def shutdown_pdf_pool() -> None:
+    """Stop the PDF extraction worker processes"""
+    global _pdf_pool
+    if _pdf_pool is not None:
+        _pdf_pool.shutdown(cancel_futures=True)
+        _pdf_pool = None
+
+
+def _download_to_temp_file(supabase, bucket: str, path: str) -> str:
+    """
+    Stream a storage object into a temporary file and return its path
+    
+    The caller deletes the file. Workers then open the PDF from disk
+    instead of each holding its own in-memory copy of the document.
+    """
+    with tempfile.NamedTemporaryFile(suffix=os.path.splitext(path)[1], delete=False) as f:
+        try:
+            for chunk in supabase.iter_download_file(bucket, path):
+                f.write(chunk)
+        except BaseException:
+            os.unlink(f.name)
+            raise
+    return f.name
+
+
+def _pdf_page_count(pdf_path: str) -> int:
+    """Count a PDF's pages (runs in a worker process)"""
+    doc = fitz.open(pdf_path, filetype="pdf")
+    try:
+        return doc.page_count
+    finally:
+        doc.close()
+
+
+def _extract_page_range(pdf_path: str, start: int, stop: int) -> List[Optional[str]]:
+    """
+    Extract text for pages [start, stop) (runs in a worker process)
+    
+    Returns one entry per page; image-only pages are returned as None.
+    """
+    doc = fitz.open(pdf_path, filetype="pdf")
+    try:
+        pages = []
+        for i in range(start, stop):
+            page = doc[i]
+            text = page.get_text("text")
+            # Only look at images when the page has (almost) no text
+            if len(text.strip()) < MIN_PAGE_TEXT_CHARS and page.get_images(full=False):
+                pages.append(None)
+            else:
+                pages.append(text)
+        return pages
+    finally:
+        doc.close()
+
+
+async def _extract_pdf_text(pdf_path: str) -> Tuple[str, List[int]]:
+    """
+    Extract text from all pages in parallel worker processes
+    
+    Pages are split into one contiguous range per worker and each range is
+    parsed in its own process (PyMuPDF must not be used from several
+    threads). Results are joined back in page order.
+    
+    Returns:
+        Tuple of (text, indices of skipped image-only pages)
+    """
+    loop = asyncio.get_running_loop()
+    pool = get_pdf_pool()
+    page_count = await loop.run_in_executor(pool, _pdf_page_count, pdf_path)
+    logger.info("📄 Extracting text from %s pages", page_count)
+    if page_count == 0:
+        return "", []
+    
+    range_size = max(1, -(-page_count // PDF_EXTRACT_WORKERS))
+    ranges = [
+        (start, min(start + range_size, page_count))
+        for start in range(0, page_count, range_size)
+    ]
+    results = await asyncio.gather(*[
+        loop.run_in_executor(pool, _extract_page_range, pdf_path, start, stop)
+        for start, stop in ranges
+    ])
+    
+    parts = []
+    skipped_pages = []
+    for i, page_text in enumerate(page_text for pages in results for page_text in pages):
+        if page_text is None:
+            skipped_pages.append(i)
+        else:
+            parts.append(page_text)
+    return "\n".join(parts), skipped_pages
+
+
+def _extract_pypdf2_text(pdf_path: str) -> str:
+    """Extract text with PyPDF2, the fallback when PyMuPDF is not installed"""
+    import PyPDF2
+    pdf_reader = PyPDF2.PdfReader(pdf_path)
+    logger.info("📄 Extracting text from %s pages", len(pdf_reader.pages))
+    return "\n".join(page.extract_text() or "" for page in pdf_reader.pages)
 
 
 async def ingest_file(
@@ -25,13 +221,12 @@ async def ingest_file(
     Returns:
         Dictionary with processing results
     """
-    settings = get_settings()
     supabase = get_supabase_client()
-    client = AsyncOpenAI(api_key=settings.openai_api_key)
+    pdf_path = None
     
     try:
         # Get file metadata
-        file_record = supabase.get_file(file_id)
+        file_record = await asyncio.to_thread(supabase.get_file, file_id)
         if not file_record:
             return {
                 "success": False,
@@ -39,85 +234,101 @@ async def ingest_file(
             }
         
         # Update status to processing
-        supabase.update_file_status(file_id, "processing")
+        await asyncio.to_thread(supabase.update_file_status, file_id, "processing")
         
-        # Download file from storage
+        # Download file from storage, streamed to a temporary file
         file_path = file_record["file_path"]
-        filename = file_record["filename"]
-        file_bytes = supabase.download_file(settings.bucket_legal, file_path)
+        bucket = file_record.get("bucket") or SETTINGS.bucket_legal
+        pdf_path = await asyncio.to_thread(_download_to_temp_file, supabase, bucket, file_path)
         
-        # Extract text from PDF using PyPDF2
+        # Extract text from PDF using PyMuPDF (C-backed, much faster than PyPDF2)
         # Note: OpenAI File Extraction API (files.parse) doesn't exist in the SDK
-        # Using PyPDF2 as the primary extraction method
-        import logging
-        logger = logging.getLogger(__name__)
-        
+        # PyPDF2 is kept as a fallback when PyMuPDF is not installed
         text = ""
+        extraction_method = "pymupdf"
+        skipped_pages: List[int] = []
         try:
-            import PyPDF2
-            pdf_reader = PyPDF2.PdfReader(io.BytesIO(file_bytes))
-            logger.info(f"📄 Extracting text from {len(pdf_reader.pages)} pages")
+            if fitz is not None:
+                text, skipped_pages = await _extract_pdf_text(pdf_path)
+                if skipped_pages:
+                    logger.info("🖼️ Skipped %s image-only pages", len(skipped_pages))
+            else:
+                # Fall back to PyPDF2 when PyMuPDF is not installed
+                extraction_method = "pypdf2"
+                text = await asyncio.to_thread(_extract_pypdf2_text, pdf_path)
             
-            for i, page in enumerate(pdf_reader.pages):
-                page_text = page.extract_text()
-                text += page_text + "\n"
-                logger.debug(f"Extracted {len(page_text)} chars from page {i+1}")
-            
-            logger.info(f"✅ Extracted {len(text)} characters total")
+            logger.info("✅ Extracted %s characters total", len(text))
             
         except ImportError:
-            logger.error("❌ PyPDF2 not installed. Install with: pip install PyPDF2")
-            supabase.update_file_status(file_id, "failed")
+            logger.error("❌ No PDF library installed. Install with: pip install pymupdf")
+            await asyncio.to_thread(supabase.update_file_status, file_id, "failed")
             return {
                 "success": False,
-                "error": "PDF extraction library not available. Please install PyPDF2."
+                "error": "PDF extraction library not available. Please install pymupdf."
             }
         except Exception as e:
-            logger.error(f"❌ PDF extraction failed: {str(e)}")
-            supabase.update_file_status(file_id, "failed")
+            logger.error("❌ PDF extraction failed: %s", e)
+            await asyncio.to_thread(supabase.update_file_status, file_id, "failed")
             return {
                 "success": False,
                 "error": f"PDF extraction failed: {str(e)}"
             }
         
         if not text:
-            supabase.update_file_status(file_id, "failed")
+            await asyncio.to_thread(supabase.update_file_status, file_id, "failed")
             return {
                 "success": False,
                 "error": "No text extracted from file"
             }
         
-        # Store the full text as a single chunk
-        supabase.create_file_chunk(
-            file_id=file_id,
-            chunk_index=0,
-            content=text,
-            metadata={"length": len(text), "extraction_method": "pypdf2"}
+        # Store the text as ~CHUNK_SIZE chunks so context reads only pull what they need
+        chunks = split_text(text)
+        await asyncio.to_thread(
+            supabase.create_file_chunks,
+            file_id,
+            [
+                {
+                    "content": content,
+                    "metadata": {
+                        "start": start,
+                        "length": len(content),
+                        "extraction_method": extraction_method,
+                        "skipped_pages": skipped_pages
+                    }
+                }
+                for start, content in chunks
+            ]
         )
         
         # Update file status to completed
-        supabase.update_file_status(
+        await asyncio.to_thread(
+            supabase.update_file_status,
             file_id,
             "completed",
-            processed_at=datetime.utcnow()
+            processed_at=datetime.now(timezone.utc)
         )
+        invalidate_file_context([file_id])
         
         return {
             "success": True,
             "file_id": file_id,
             "text_length": len(text),
-            "chunks_created": 1,
+            "chunks_created": len(chunks),
             "message": f"Successfully extracted {len(text)} characters"
         }
     
     except Exception as e:
         # Update file status to failed
-        supabase.update_file_status(file_id, "failed")
+        await asyncio.to_thread(supabase.update_file_status, file_id, "failed")
         
         return {
             "success": False,
             "error": f"File extraction failed: {str(e)}"
         }
+    
+    finally:
+        if pdf_path:
+            os.unlink(pdf_path)
 
 
 async def get_file_context(
@@ -137,34 +348,75 @@ async def get_file_context(
     if not file_ids:
         return ""
     
-    supabase = get_supabase_client()
-    
-    # Get all chunks for the files
-    chunks = supabase.get_chunks_by_file_ids(file_ids)
+    cache_key = (tuple(sorted(file_ids)), max_chars)
+    cached = _context_cache.get(cache_key)
+    if cached is not None:
+        return cached
     
-    # Get file metadata for citations
-    files_data = {}
-    for file_id in file_ids:
-        file_record = supabase.get_file(file_id)
-        if file_record:
-            files_data[file_id] = file_record["filename"]
+    supabase = get_supabase_client()
     
+    # Chunks are fetched a page at a time until max_chars is spent. Chunk
+    # sizes vary (short chunks are flushed before long paragraphs are split),
+    # so the page size is only a guess at how many fit, not a bound; further
+    # pages are read only if the first one runs short of the budget.
+    page_size = max_chars // CHUNK_SIZE + len(file_ids)
+    # Chunks and file metadata (for citations) are independent reads, so run
+    # them concurrently off the event loop
+    chunks, files_data = await asyncio.gather(
+        asyncio.to_thread(supabase.get_chunks_by_file_ids, file_ids, page_size),
+        asyncio.to_thread(supabase.get_files_by_ids, file_ids)
+    )
+
     # Combine chunks with file citations
-    context_parts = []
+    context_parts: List[str] = []
     total_chars = 0
+    offset = 0
+
+    while chunks:
+        for chunk in chunks:
+            file_id = chunk["file_id"]
+            file_record = files_data.get(file_id)
+            filename = file_record["filename"] if file_record else "Unknown"
+            content = chunk["content"]
+
+            # Add citation header
+            chunk_text = f"[Document: {filename}]\n{content}\n"
+
+            if total_chars + len(chunk_text) > max_chars:
+                break
+
+            context_parts.append(chunk_text)
+            total_chars += len(chunk_text)
+        else:
+            # Whole page fit; a short page means there are no more chunks
+            if len(chunks) < page_size:
+                break
+            offset += page_size
+            chunks = await asyncio.to_thread(
+                supabase.get_chunks_by_file_ids, file_ids, page_size, offset
+            )
+            continue
+        break
+
+    context = "\n".join(context_parts)
+    _context_cache[cache_key] = context
+    for file_id in cache_key[0]:
+        keys = _context_keys_by_file.get(file_id, set())
+        keys.add(cache_key)
+        _context_keys_by_file[file_id] = keys
+    return context
+
+
+def invalidate_file_context(file_ids: List[str]) -> None:
+    """
+    Drop cached document context for any file set containing these files,
+    and the client's cached records and chunks for them
     
-    for chunk in chunks:
-        file_id = chunk["file_id"]
-        filename = files_data.get(file_id, "Unknown")
-        content = chunk["content"]
-        
-        # Add citation header
-        chunk_text = f"[Document: {filename}]\n{content}\n"
-        
-        if total_chars + len(chunk_text) > max_chars:
-            break
-        
-        context_parts.append(chunk_text)
-        total_chars += len(chunk_text)
-    
-    return "\n".join(context_parts)
+    Args:
+        file_ids: IDs of files that were re-ingested or deleted
+    """
+    for file_id in file_ids:
+        for key in _context_keys_by_file.pop(file_id, ()):
+            _context_cache.pop(key, None)
+    # Rows may have changed outside the client (direct SQL paths)
+    get_supabase_client().forget_files(file_ids)
@@ -2,16 +2,109 @@
 LLM provider integrations using OpenAI API with streaming support
 and connectivity diagnostics for GPT-5
 """
-import json
+import asyncio
+from functools import lru_cache
+from dataclasses import dataclass
 from typing import AsyncGenerator, List, Dict, Optional
 
-from openai import AsyncOpenAI
-from openai import OpenAI
+from openai import AsyncOpenAI, RateLimitError
 import httpx
-import time
+import orjson
 import logging
 
-from app.utils import get_settings
+from app.utils import SETTINGS
+
+logger = logging.getLogger(__name__)
+
+# Retries for 429s from OpenAI, with exponential backoff (1s, 2s, 4s)
+RATE_LIMIT_RETRIES = 3
+RATE_LIMIT_BACKOFF = 1.0
+
+
+@lru_cache(maxsize=1)
+def get_async_openai_client() -> AsyncOpenAI:
+    """Get cached async OpenAI client (reuses the HTTP/2 connection pool)"""
+    return AsyncOpenAI(
+        api_key=SETTINGS.openai_api_key,
+        http_client=httpx.AsyncClient(
+            http2=True,
+            limits=httpx.Limits(max_connections=64, max_keepalive_connections=32),
+            timeout=httpx.Timeout(60.0, connect=5.0)
+        )
+    )
+
+
+@lru_cache(maxsize=1)
+def get_stream_semaphore() -> asyncio.Semaphore:
+    """Get the semaphore capping concurrent upstream completions"""
+    return asyncio.Semaphore(SETTINGS.openai_max_concurrency)
+
+
+async def _create_with_retry(create, **kwargs):
+    """Call an OpenAI create method, backing off and retrying on rate limits"""
+    for attempt in range(RATE_LIMIT_RETRIES + 1):
+        try:
+            return await create(**kwargs)
+        except RateLimitError:
+            if attempt == RATE_LIMIT_RETRIES:
+                raise
+            delay = RATE_LIMIT_BACKOFF * (2 ** attempt)
+            logger.warning("↻ Rate limited by OpenAI. Retrying in %.1fs...", delay)
+            await asyncio.sleep(delay)
+
+
+@dataclass(frozen=True, slots=True)
+class StreamDelta:
+    """
+    One streamed item: generated text, or a pre-encoded control payload
+
+    Content deltas carry only `content`; their JSON payload is built on
+    demand so consumers that batch deltas never encode individual tokens.
+    """
+    content: str = ""
+    raw: str = ""
+    done: bool = False
+
+    @property
+    def payload(self) -> str:
+        """JSON SSE data for this item"""
+        return self.raw or orjson.dumps({"content": self.content}).decode()
+
+
+DONE_DELTA = StreamDelta(raw="[DONE]", done=True)
+
+
+# Memoized result of the GPT-5 availability probe (None = not probed yet)
+_gpt5_available: Optional[bool] = None
+
+
+# Responses API stream events we forward, keyed by event type
+_RESPONSE_EVENT_HANDLERS = {
+    "response.output_text.delta": lambda event: event.delta,
+}
+
+
+def _response_output_text(resp) -> str:
+    """Extract the generated text from a (non-streamed) Responses API result"""
+    text = getattr(resp, "output_text", None)
+    if text:
+        return text
+    for item in getattr(resp, "output", None) or []:
+        for part in getattr(item, "content", None) or []:
+            if getattr(part, "type", None) == "output_text":
+                return part.text
+    return ""
+
+
+def to_responses_input(msgs: List[Dict[str, str]]) -> List[Dict]:
+    """Convert chat-completions style messages to Responses API input"""
+    return [
+        {
+            "role": m.get("role", "user"),
+            "content": [{"type": "input_text", "text": m.get("content", "")}],
+        }
+        for m in msgs
+    ]
 
 
 async def openai_stream(
@@ -19,7 +112,7 @@ async def openai_stream(
     model: Optional[str] = None,
     temperature: float = 0.7,
     max_tokens: int = 4096
-) -> AsyncGenerator[str, None]:
+) -> AsyncGenerator[StreamDelta, None]:
     """
     Stream chat completion from OpenAI API
     
@@ -30,31 +123,19 @@ async def openai_stream(
         max_tokens: Maximum tokens to generate
     
     Yields:
-        SSE-formatted chunks with content
+        StreamDelta items; `content` is the generated text (empty for error
+        payloads and the final "[DONE]"), `payload` the JSON SSE data
     """
-    settings = get_settings()
-    client = AsyncOpenAI(api_key=settings.openai_api_key)
+    client = get_async_openai_client()
     
     if model is None:
-        model = settings.model_id
+        model = SETTINGS.model_id
     
     async def _stream_with_model(model_id: str):
         """Attempt streaming with a specific model. Yields chunks on success; yields nothing if creation failed."""
-        nonlocal client
         try:
             if str(model_id).startswith("gpt-5"):
                 # Use Responses API for GPT-5
-                def to_responses_input(msgs: List[Dict[str, str]]):
-                    formatted = []
-                    for m in msgs:
-                        role = m.get("role", "user")
-                        text = m.get("content", "")
-                        formatted.append({
-                            "role": role,
-                            "content": [{"type": "input_text", "text": text}],
-                        })
-                    return formatted
-
                 # Try streaming first
                 try:
                     stream = await client.responses.stream(
@@ -64,37 +145,28 @@ async def openai_stream(
                         max_output_tokens=max_tokens,
                     )
                     async for event in stream:
-                        etype = getattr(event, "type", None)
-                        if etype == "response.output_text.delta":
-                            delta_text = getattr(event, "delta", "") or ""
+                        handler = _RESPONSE_EVENT_HANDLERS.get(event.type)
+                        if handler:
+                            delta_text = handler(event)
                             if delta_text:
-                                yield json.dumps({"content": delta_text})
+                                yield StreamDelta(content=delta_text)
                     # Ensure end signal
-                    yield "[DONE]"
+                    yield DONE_DELTA
                     return
                 except Exception:
                     # Fallback to non-stream create and yield once
                     try:
-                        resp = await client.responses.create(
+                        resp = await _create_with_retry(
+                            client.responses.create,
                             model=model_id,
                             input=to_responses_input(messages),
                             temperature=temperature,
                             max_output_tokens=max_tokens,
                         )
-                        text = None
-                        try:
-                            text = resp.output_text if hasattr(resp, "output_text") else None
-                        except Exception:
-                            text = None
-                        if not text:
-                            try:
-                                first = resp.output[0]
-                                text = getattr(first, "content", [{}])[0].get("text", {}).get("value")
-                            except Exception:
-                                text = None
+                        text = _response_output_text(resp)
                         if text:
-                            yield json.dumps({"content": text})
-                            yield "[DONE]"
+                            yield StreamDelta(content=text)
+                            yield DONE_DELTA
                             return
                         return
                     except Exception:
@@ -102,7 +174,8 @@ async def openai_stream(
                         return
             else:
                 # Chat Completions for non-GPT-5
-                response = await client.chat.completions.create(
+                response = await _create_with_retry(
+                    client.chat.completions.create,
                     model=model_id,
                     messages=messages,
                     stream=True,
@@ -114,44 +187,69 @@ async def openai_stream(
                         delta = chunk.choices[0].delta
                         content = getattr(delta, 'content', None) or ""
                         if content:
-                            yield json.dumps({'content': content})
-                yield "[DONE]"
+                            yield StreamDelta(content=content)
+                yield DONE_DELTA
                 return
         except Exception:
             return
 
     # Try requested model, then graceful fallbacks
-    primary_model = model or settings.model_id
-    fallbacks = [m for m in [primary_model, 'gpt-4o', 'gpt-4o-mini']]
-
-    tried_any = False
-    for m in fallbacks:
-        tried_any = True
-        success = False
-        async for out in _stream_with_model(m):
-            # If we got outputs, pass them through and mark success
-            success = True
+    primary_model = model or SETTINGS.model_id
+    # Order-preserving dedupe so a gpt-4o primary isn't attempted twice
+    fallbacks = list(dict.fromkeys([primary_model, 'gpt-4o', 'gpt-4o-mini']))
+
+    # Deltas are buffered through a queue so the concurrency slot is held
+    # only while reading upstream, not while a slow SSE client drains them
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def produce():
+        try:
+            # Hold a slot for the upstream call so bursts queue here instead
+            # of turning into a storm of 429s
+            async with get_stream_semaphore():
+                for m in fallbacks:
+                    first = True
+                    async for out in _stream_with_model(m):
+                        # Once a model produces output, pass everything through
+                        first = False
+                        queue.put_nowait(out)
+                    if not first:
+                        return
+
+            # If all attempts failed, send a useful error message
+            fallback_list = ', '.join(fallbacks)
+            queue.put_nowait(StreamDelta(raw=orjson.dumps({'error': f"All model attempts failed. Tried: {fallback_list}. Check API key permissions and model availability."}).decode()))
+        finally:
+            queue.put_nowait(None)
+
+    producer = asyncio.create_task(produce())
+    try:
+        while (out := await queue.get()) is not None:
             yield out
-        if success:
-            return
+    finally:
+        # Consumer went away early: stop reading upstream and free the slot
+        producer.cancel()
 
-    if not tried_any or True:
-        # If all attempts failed, send a useful error message
-        fallback_list = ', '.join(fallbacks)
-        yield json.dumps({'error': f"All model attempts failed. Tried: {fallback_list}. Check API key permissions and model availability."})
 
+async def test_gpt5_connection() -> bool:
+    """
+    Check whether GPT-5 is available for the configured API key.
+    The probe runs once; its result is memoized for the process lifetime.
+    """
+    global _gpt5_available
+    if _gpt5_available is None:
+        _gpt5_available = await _probe_gpt5_connection()
+    return _gpt5_available
 
-def test_gpt5_connection() -> bool:
+
+async def _probe_gpt5_connection() -> bool:
     """
     Try a simple GPT-5 completion using the Responses API. Returns True if available.
     Behavior:
       - If 400/404/model_not_found: log and suggest using gpt-4o; return False
       - On network/timeout: retry twice with exponential backoff
     """
-    settings = get_settings()
-    logger = logging.getLogger(__name__)
-
-    client = OpenAI(api_key=settings.openai_api_key)
+    client = get_async_openai_client()
 
     # Always test GPT-5 explicitly as primary
     target_model = 'gpt-5'
@@ -169,23 +267,15 @@ def test_gpt5_connection() -> bool:
     while attempts < 3:
         try:
             attempts += 1
-            logger.info(f"🔎 Testing GPT-5 connectivity (attempt {attempts})")
-            resp = client.responses.create(
+            logger.info("🔎 Testing GPT-5 connectivity (attempt %s)", attempts)
+            resp = await client.responses.create(
                 model=target_model,
                 input=test_input,
                 max_output_tokens=16,
             )
-            # Extract response text
-            text = ""
-            try:
-                text = resp.output_text if hasattr(resp, "output_text") else ""
-                if not text and hasattr(resp, "output"):
-                    first = resp.output[0]
-                    text = getattr(first, "content", [{}])[0].get("text", {}).get("value", "")
-            except Exception:
-                text = ""
+            text = _response_output_text(resp)
             
-            logger.info(f"✅ GPT-5 test succeeded. Sample: '{text}'")
+            logger.info("✅ GPT-5 test succeeded. Sample: '%s'", text)
             return True
         except Exception as e:
             # Extract status and error type when available
@@ -193,7 +283,7 @@ def test_gpt5_connection() -> bool:
             error_type = getattr(getattr(e, 'error', None), 'type', None) or getattr(e, 'type', None)
             message = str(e)
 
-            logger.error(f"❌ GPT-5 test failed: status={status_code}, type={error_type}, message={message}")
+            logger.error("❌ GPT-5 test failed: status=%s, type=%s, message=%s", status_code, error_type, message)
 
             # Model not available/access denied cases
             if (status_code in (400, 404)) or (error_type in ("model_not_found", "invalid_request_error")):
@@ -205,8 +295,8 @@ def test_gpt5_connection() -> bool:
                 status_code in (408, 429, 500, 502, 503, 504)
             ):
                 if attempts < 3:
-                    logger.warning(f"↻ Transient error. Retrying in {delay:.1f}s...")
-                    time.sleep(delay)
+                    logger.warning("↻ Transient error. Retrying in %.1fs...", delay)
+                    await asyncio.sleep(delay)
                     delay *= 2
                     continue
                 else:
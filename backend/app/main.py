@@ -2,14 +2,26 @@
 Scopic Legal Backend - FastAPI Application
 Main entry point with all API routes
 """
+import asyncio
 import logging
-import json
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Optional
+from functools import lru_cache
+from typing import Optional, List, Dict, Any
 
+import httpx
+import orjson
 from fastapi import FastAPI, HTTPException, Header
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-from sse_starlette.sse import EventSourceResponse
+from fastapi.middleware.gzip import GZipMiddleware
+from cachetools import TTLCache
+from fastapi_cache import FastAPICache
+from fastapi_cache.backends.redis import RedisBackend
+from redis import asyncio as aioredis
+from sse_starlette.sse import EventSourceResponse, ServerSentEvent
 
 from app.models import (
     ChatCreate, ChatResponse, ChatMessageRequest,
@@ -17,9 +29,18 @@ from app.models import (
     FileDeleteRequest, AdminOverviewResponse
 )
 from app.supabase_client import get_supabase_client
-from app.llm_providers import openai_stream, test_gpt5_connection
-from app.ingest import ingest_file, get_file_context
-from app.utils import get_settings, get_allowed_origins, generate_file_path, verify_admin_key
+from app.llm_providers import openai_stream, test_gpt5_connection, get_async_openai_client
+from app.ingest import ingest_file, get_file_context, invalidate_file_context, shutdown_pdf_pool
+from app.db import (
+    init_pool, close_pool, get_pool, fetch_admin_stats, fetch_user_stats,
+    append_message_content, delete_chat_cascade as fetch_delete_chat_cascade,
+    delete_user_cascade as fetch_delete_user_cascade, delete_file_owned as fetch_delete_file_owned
+)
+from app.middleware import ETagMiddleware
+from app.utils import (
+    SETTINGS, SUPABASE_URL, SUPABASE_SERVICE_KEY,
+    get_allowed_origins, generate_file_path, verify_admin_key
+)
 
 # Configure logging
 logging.basicConfig(
@@ -32,7 +53,9 @@ logger = logging.getLogger(__name__)
 app = FastAPI(
     title="Scopic Legal Backend API",
     description="FastAPI backend for Scopic Legal - AI Assistant for Startup Founders",
-    version="1.0.0"
+    version="1.0.0",
+    # orjson serializes large list payloads (users, files, chats) in C
+    default_response_class=ORJSONResponse
 )
 
 # CORS middleware
@@ -44,12 +67,243 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# ETag / If-None-Match on file and chat listings; added before GZip so the
+# tag is computed over the uncompressed body
+app.add_middleware(ETagMiddleware)
+
+# Compress larger JSON responses (user lists, message history, file chunks)
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=5)
+
+# System prompt - minimal and natural, let the model respond like ChatGPT
+SYSTEM_PROMPT_BASE = "You are a helpful AI assistant."
+SYSTEM_MESSAGE = {"role": "system", "content": SYSTEM_PROMPT_BASE}
+
+# Streaming batch tuning: deltas per SSE frame grow by STREAM_BATCH_GROWTH
+# up to STREAM_BATCH_MAX; pending deltas are flushed after STREAM_FLUSH_INTERVAL
+STREAM_BATCH_GROWTH = 3
+STREAM_BATCH_MAX = 50
+STREAM_FLUSH_INTERVAL = 0.025  # seconds
+
+# Response cache keys are "<CACHE_PREFIX>:<namespace>:..."
+CACHE_PREFIX = "scopic"
+
+# Admin overview stats are computed on request and reused for this long;
+# they tolerate being slightly stale
+ADMIN_STATS_TTL = 30  # seconds
+_admin_stats: Optional[Dict[str, Any]] = None
+_admin_stats_at = 0.0
+_admin_stats_lock = asyncio.Lock()
+
+# Storage bucket for uploaded documents (settings are immutable once loaded)
+BUCKET_LEGAL = SETTINGS.bucket_legal
+
+# Signed download URLs are reused within 5-minute windows, so a cached URL
+# always has at least expires_in - SIGNED_URL_WINDOW left when served
+SIGNED_URL_NAMESPACE = "sig"
+SIGNED_URL_WINDOW = 300  # seconds
+
+# Without Redis, signed URLs are cached in process. Keys change every window
+# and old ones are never read again, so the cache must evict on its own.
+SIGNED_URL_CACHE_SIZE = 4096
+_signed_url_cache: TTLCache = TTLCache(maxsize=SIGNED_URL_CACHE_SIZE, ttl=SIGNED_URL_WINDOW)
+
+# Persist streamed assistant text every this many characters
+MESSAGE_FLUSH_CHARS = 2048
+
+# Max concurrent per-user auth lookups on the admin users fallback path
+ADMIN_LOOKUP_CONCURRENCY = 16
+
+# Worker threads for blocking Supabase calls made via asyncio.to_thread. The
+# default executor has min(32, CPUs + 4) threads - about 5 on a 1-vCPU
+# instance - which would queue concurrent requests' DB calls behind each other
+BLOCKING_IO_THREADS = 64
+
+# Readiness probe: per-dependency timeout, and how long a successful
+# OpenAI check is trusted before it is repeated
+READY_CHECK_TIMEOUT = 1.0  # seconds
+READY_OPENAI_TTL = 30.0  # seconds
+_openai_ready_at: Optional[float] = None
+
 # Supabase client will be initialized lazily on first use
 def get_supabase():
     """Get Supabase client instance"""
     return get_supabase_client()
 
 
+@lru_cache(maxsize=1)
+def get_admin_http_client() -> httpx.AsyncClient:
+    """Get pooled HTTP client for direct Supabase Auth admin calls"""
+    return httpx.AsyncClient(
+        http2=True,
+        timeout=10.0,
+        limits=httpx.Limits(max_keepalive_connections=10)
+    )
+
+
+# Fire-and-forget tasks are referenced here so they aren't garbage collected
+# mid-flight, and so shutdown can wait for them to finish
+background_tasks: set = set()
+
+
+def run_in_background(func, *args, after: Optional[asyncio.Task] = None, **kwargs) -> asyncio.Task:
+    """
+    Run a call without awaiting its result. Blocking functions run in a
+    worker thread; coroutine functions are awaited on the loop. If `after`
+    is given, the call starts only once that task has finished, which keeps
+    dependent writes in order.
+    """
+    async def runner():
+        try:
+            if after is not None:
+                await asyncio.gather(after, return_exceptions=True)
+            if asyncio.iscoroutinefunction(func):
+                await func(*args, **kwargs)
+            else:
+                await asyncio.to_thread(func, *args, **kwargs)
+        except Exception as e:
+            logger.error("❌ Background task %s failed: %s", func.__name__, e)
+    
+    task = asyncio.create_task(runner())
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+
+@app.on_event("startup")
+async def init_blocking_io():
+    """Size the worker pool for blocking Supabase calls and connect the client"""
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=BLOCKING_IO_THREADS, thread_name_prefix="supabase")
+    )
+    await asyncio.to_thread(get_supabase)
+
+
+@app.on_event("startup")
+async def open_db_pool():
+    """Create the Postgres pool used for admin aggregates (if configured)"""
+    await init_pool()
+
+
+@app.on_event("startup")
+async def init_response_cache():
+    """Use Redis for response caching when configured (else _signed_url_cache is used)"""
+    if SETTINGS.redis_url:
+        FastAPICache.init(RedisBackend(aioredis.from_url(SETTINGS.redis_url)), prefix=CACHE_PREFIX)
+
+
+async def load_admin_stats() -> Dict[str, Any]:
+    """Compute admin overview statistics"""
+    if get_pool():
+        return await fetch_admin_stats()
+    return await asyncio.to_thread(get_supabase().get_admin_stats)
+
+
+async def get_admin_stats_snapshot() -> Dict[str, Any]:
+    """
+    Get admin stats, recomputing them at most once per ADMIN_STATS_TTL
+
+    Concurrent requests for a stale snapshot wait for a single recompute.
+    """
+    global _admin_stats, _admin_stats_at
+    async with _admin_stats_lock:
+        if _admin_stats is None or time.monotonic() - _admin_stats_at > ADMIN_STATS_TTL:
+            _admin_stats = await load_admin_stats()
+            _admin_stats_at = time.monotonic()
+        return _admin_stats
+
+
+def _signed_url_cache_key(bucket: str, path: str) -> str:
+    """Cache key for a signed URL in the current SIGNED_URL_WINDOW"""
+    window = int(time.time() // SIGNED_URL_WINDOW)
+    return f"{CACHE_PREFIX}:{SIGNED_URL_NAMESPACE}:{bucket}:{path}:{window}"
+
+
+async def get_signed_download_url_cached(bucket: str, path: str, expires_in: int = 3600) -> str:
+    """
+    Get a signed download URL, reusing one signed in the current window
+
+    Signing is a Storage API round-trip; the cache (Redis when configured)
+    lets every reader of a file share one URL per window.
+    """
+    urls = await get_signed_download_urls_cached(bucket, [path], expires_in)
+    return urls.get(path, "")
+
+
+async def get_signed_download_urls_cached(
+    bucket: str,
+    paths: List[str],
+    expires_in: int = 3600
+) -> Dict[str, str]:
+    """Get signed download URLs keyed by path; cache misses are signed in one batch"""
+    keys = {path: _signed_url_cache_key(bucket, path) for path in paths}
+    urls = {}
+    try:
+        cached = await _read_signed_urls(list(keys.values()))
+        for path, value in zip(keys, cached):
+            if value:
+                urls[path] = value.decode() if isinstance(value, bytes) else value
+    except Exception as e:
+        logger.warning("⚠️ Signed URL cache read failed: %s", e)
+
+    missing = [path for path in keys if path not in urls]
+    if not missing:
+        return urls
+
+    # The batch endpoint skips missing objects instead of failing, so it is
+    # used even for a single path
+    signed = await asyncio.to_thread(
+        get_supabase().get_signed_download_urls, bucket, missing, expires_in
+    )
+    urls.update(signed)
+    try:
+        await _write_signed_urls({keys[path]: url for path, url in signed.items()})
+    except Exception as e:
+        logger.warning("⚠️ Signed URL cache write failed: %s", e)
+    return urls
+
+
+async def _read_signed_urls(keys: List[str]) -> List[Any]:
+    """Read cached signed URLs (None for misses) from Redis or the in-process cache"""
+    if not SETTINGS.redis_url:
+        return [_signed_url_cache.get(key) for key in keys]
+    backend = FastAPICache.get_backend()
+    return await asyncio.gather(*[backend.get(key) for key in keys])
+
+
+async def _write_signed_urls(entries: Dict[str, str]) -> None:
+    """Cache signed URLs by key for SIGNED_URL_WINDOW seconds"""
+    if not SETTINGS.redis_url:
+        _signed_url_cache.update(entries)
+        return
+    backend = FastAPICache.get_backend()
+    await asyncio.gather(*[
+        backend.set(key, url.encode(), expire=SIGNED_URL_WINDOW)
+        for key, url in entries.items()
+    ])
+
+
+async def add_download_urls(files: List[Dict[str, Any]], expires_in: int = 3600) -> None:
+    """Attach a signed `download_url` to each file record that has a storage path"""
+    paths = [f["file_path"] for f in files if f.get("file_path")]
+    if not paths:
+        return
+    urls = await get_signed_download_urls_cached(BUCKET_LEGAL, paths, expires_in)
+    for f in files:
+        url = urls.get(f.get("file_path"))
+        if url:
+            f["download_url"] = url
+
+
+@app.on_event("shutdown")
+async def drain_background_tasks():
+    """Wait for pending background writes before the process exits"""
+    if background_tasks:
+        logger.info("⏳ Waiting for %s background tasks", len(background_tasks))
+        await asyncio.gather(*background_tasks, return_exceptions=True)
+    await close_pool()
+    shutdown_pdf_pool()
+
+
 @app.get("/")
 async def root():
     """Health check endpoint"""
@@ -61,8 +315,9 @@ async def root():
 
 
 @app.get("/health")
+@app.api_route("/healthz", methods=["GET", "HEAD"])
 async def health_check():
-    """Detailed health check"""
+    """Liveness check - static, never touches external services"""
     return {
         "status": "healthy",
         "timestamp": "2024-01-01T00:00:00Z",
@@ -73,6 +328,50 @@ async def health_check():
     }
 
 
+async def _check_database() -> None:
+    """Run a minimal query against the database"""
+    pool = get_pool()
+    if pool:
+        await pool.fetchval("SELECT 1")
+    else:
+        await asyncio.to_thread(
+            get_supabase().client.table("chats").select("id", count="exact", head=True).limit(1).execute
+        )
+
+
+async def _check_openai() -> None:
+    """List models to verify OpenAI is reachable; successes are reused for READY_OPENAI_TTL"""
+    global _openai_ready_at
+    now = time.monotonic()
+    if _openai_ready_at is not None and now - _openai_ready_at < READY_OPENAI_TTL:
+        return
+    await get_async_openai_client().models.list()
+    _openai_ready_at = now
+
+
+@app.get("/readyz")
+async def readiness_check():
+    """Readiness check - verifies the database and OpenAI are reachable"""
+    checks = {"database": _check_database(), "openai": _check_openai()}
+    results = await asyncio.gather(
+        *[asyncio.wait_for(check, timeout=READY_CHECK_TIMEOUT) for check in checks.values()],
+        return_exceptions=True
+    )
+    services = {}
+    for name, result in zip(checks, results):
+        if isinstance(result, BaseException):
+            logger.warning("⚠️ Readiness check failed for %s: %r", name, result)
+            services[name] = "unavailable"
+        else:
+            services[name] = "ok"
+
+    ready = all(status == "ok" for status in services.values())
+    return ORJSONResponse(
+        status_code=200 if ready else 503,
+        content={"status": "ready" if ready else "not_ready", "services": services}
+    )
+
+
 # ============================================================================
 # CHAT ROUTES
 # ============================================================================
@@ -81,8 +380,9 @@ async def health_check():
 async def create_chat(chat_data: ChatCreate):
     """Create a new chat"""
     try:
-        logger.info(f"📝 Creating new chat for user: {chat_data.user_id}")
-        chat = get_supabase().create_chat(
+        logger.info("📝 Creating new chat for user: %s", chat_data.user_id)
+        chat = await asyncio.to_thread(
+            get_supabase().create_chat,
             user_id=chat_data.user_id,
             title=chat_data.title
         )
@@ -91,11 +391,11 @@ async def create_chat(chat_data: ChatCreate):
             logger.error("❌ Failed to create chat - no response from database")
             raise HTTPException(status_code=500, detail="Failed to create chat")
         
-        logger.info(f"✅ Chat created successfully: {chat['id']}")
+        logger.info("✅ Chat created successfully: %s", chat['id'])
         return ChatResponse(**chat)
     
     except Exception as e:
-        logger.error(f"❌ Error creating chat: {str(e)}")
+        logger.error("❌ Error creating chat: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -103,7 +403,7 @@ async def create_chat(chat_data: ChatCreate):
 async def get_chat(chat_id: str):
     """Get a specific chat"""
     try:
-        chat = get_supabase().get_chat(chat_id)
+        chat = await asyncio.to_thread(get_supabase().get_chat, chat_id)
         
         if not chat:
             raise HTTPException(status_code=404, detail="Chat not found")
@@ -120,6 +420,62 @@ async def get_chat(chat_id: str):
 # CHAT DELETE ROUTE
 # ============================================================================
 
+# Error codes for a SQL function that hasn't been deployed (asyncpg / PostgREST)
+MISSING_FUNCTION_CODES = ("42883", "PGRST202")
+
+
+def _error_code(error: Exception) -> Optional[str]:
+    """SQLSTATE/PostgREST code of a database error (asyncpg or postgrest)"""
+    return getattr(error, "sqlstate", None) or getattr(error, "code", None)
+
+
+def _raise_for_ownership_error(error: Exception, not_found: str, forbidden: str) -> None:
+    """
+    Map the SQLSTATEs raised by the ownership-checking delete functions to
+    HTTP errors. Returns only when the function itself is missing, so the
+    caller can fall back; anything else is re-raised.
+    """
+    code = _error_code(error)
+    if code == "P0002":
+        raise HTTPException(status_code=404, detail=not_found)
+    if code == "42501":
+        raise HTTPException(status_code=403, detail=forbidden)
+    if code == "22P02":
+        raise HTTPException(status_code=400, detail="Invalid ID")
+    if code not in MISSING_FUNCTION_CODES:
+        raise error
+
+
+async def _delete_chat_stepwise(chat_id: str, user_id: str) -> List[Dict[str, Any]]:
+    """
+    Delete a chat table by table, for databases without delete_chat_cascade
+
+    Returns the deleted files ({file_id, file_path, bucket}), like the SQL function.
+    """
+    # Reads first, then the independent child deletes together; the chat row
+    # goes last once nothing references it
+    chat, files = await asyncio.gather(
+        asyncio.to_thread(get_supabase().get_chat, chat_id),
+        asyncio.to_thread(get_supabase().get_files_by_chat, chat_id)
+    )
+    if not chat:
+        raise HTTPException(status_code=404, detail="Chat not found")
+    if chat.get("user_id") != user_id:
+        raise HTTPException(status_code=403, detail="Not authorized to delete this chat")
+
+    file_ids = [f["id"] for f in files]
+    await asyncio.gather(
+        asyncio.to_thread(get_supabase().delete_messages_by_chat, chat_id),
+        asyncio.to_thread(get_supabase().delete_file_chunks_by_file_ids, file_ids),
+        asyncio.to_thread(get_supabase().delete_file_records_by_ids, file_ids)
+    )
+    await asyncio.to_thread(get_supabase().delete_chat, chat_id)
+    return [
+        {"file_id": f["id"], "file_path": f.get("file_path"), "bucket": f.get("bucket")}
+        for f in files
+    ]
+
+
 @app.delete("/v1/chats/{chat_id}")
 async def delete_chat(chat_id: str, user_id: Optional[str] = Header(None, alias="X-User-Id")):
     """
@@ -127,43 +483,31 @@ async def delete_chat(chat_id: str, user_id: Optional[str] = Header(None, alias=
 
     Security: Requires `X-User-Id` header and ownership of the chat.
     Steps:
-      - Verify chat exists and belongs to user
-      - Delete messages for chat
-      - Delete files' chunks, storage objects, and file records linked to chat
-      - Delete chat record
+      - Verify ownership and delete messages, file chunks, file records and
+        the chat in one transaction (delete_chat_cascade SQL function)
+      - Delete the files' storage objects
     """
     try:
         if not user_id:
             raise HTTPException(status_code=400, detail="Missing X-User-Id header")
 
-        # Verify chat exists and ownership
-        chat = get_supabase().get_chat(chat_id)
-        if not chat:
-            raise HTTPException(status_code=404, detail="Chat not found")
-        if chat.get("user_id") != user_id:
-            raise HTTPException(status_code=403, detail="Not authorized to delete this chat")
-
-        # Delete messages
-        get_supabase().delete_messages_by_chat(chat_id)
-
-        # Gather files for this chat
-        files = get_supabase().get_files_by_chat(chat_id)
-        file_ids = [f["id"] for f in files]
-
-        # Delete file chunks
-        get_supabase().delete_file_chunks_by_file_ids(file_ids)
-
-        # Delete files from storage (best-effort)
-        for f in files:
-            path = f.get("file_path")
-            if path:
-                get_supabase().delete_storage_file(path)
-
-        # Delete file records
-        get_supabase().delete_file_records_by_ids(file_ids)
+        try:
+            if get_pool():
+                deleted_files = await fetch_delete_chat_cascade(chat_id, user_id)
+            else:
+                deleted_files = await asyncio.to_thread(
+                    get_supabase().delete_chat_cascade, chat_id, user_id
+                )
+        except Exception as e:
+            _raise_for_ownership_error(e, "Chat not found", "Not authorized to delete this chat")
+            # Function not deployed yet (migrations/002_delete_chat_cascade.sql)
+            logger.warning("⚠️ delete_chat_cascade not found, deleting chat step by step")
+            deleted_files = await _delete_chat_stepwise(chat_id, user_id)
 
-        # Finally delete the chat
-        get_supabase().delete_chat(chat_id)
+        # Delete storage objects (best-effort, one bulk call per bucket)
+        await asyncio.to_thread(get_supabase().delete_storage_objects, deleted_files)
+        invalidate_file_context([f["file_id"] for f in deleted_files])
+        get_supabase().forget_chats([chat_id])
 
         return {"status": "deleted", "chat_id": chat_id}
 
@@ -173,10 +517,18 @@ async def delete_chat(chat_id: str, user_id: Optional[str] = Header(None, alias=
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/v1/chats/{chat_id}/messages")
-async def get_chat_messages(chat_id: str, limit: int = 100):
-    """Get all messages for a chat"""
+async def get_chat_messages(chat_id: str, limit: int = 100, after: Optional[datetime] = None):
+    """
+    Get a chat's messages: the latest `limit`, or with ?after=<created_at>
+    only the ones newer than the last message the client already has
+    """
     try:
-        messages = get_supabase().get_chat_messages(chat_id, limit=limit)
+        messages = await asyncio.to_thread(
+            get_supabase().get_chat_messages,
+            chat_id,
+            limit=limit,
+            after=after.isoformat() if after else None
+        )
         return {"messages": messages}
     
     except Exception as e:
@@ -190,55 +542,53 @@ async def send_message(chat_id: str, request: ChatMessageRequest):
     Returns Server-Sent Events (SSE) stream
     """
     try:
-        logger.info(f"💬 New message in chat {chat_id}: '{request.message[:50]}...'")
+        logger.info("💬 New message in chat %s: '%s...'", chat_id, request.message[:50])
+        
+        if request.file_ids:
+            logger.info("📄 Loading context from %s files", len(request.file_ids))
+        
+        # Load chat, prior history and file context concurrently. History is
+        # read before the new user message is stored, so it holds only the
+        # previous turns (19 + the current message = 20).
+        chat, messages, context = await asyncio.gather(
+            asyncio.to_thread(get_supabase().get_chat, chat_id),
+            # The prompt only needs role and content from history
+            asyncio.to_thread(get_supabase().get_chat_messages, chat_id, 19, columns="role,content"),
+            get_file_context(file_ids=request.file_ids, max_chars=10000)
+        )
         
         # Verify chat exists
-        chat = get_supabase().get_chat(chat_id)
         if not chat:
-            logger.error(f"❌ Chat not found: {chat_id}")
+            logger.error("❌ Chat not found: %s", chat_id)
             raise HTTPException(status_code=404, detail="Chat not found")
         
-        # Save user message
-        get_supabase().create_message(
+        if context:
+            logger.info("✅ Context loaded: %s characters", len(context))
+        
+        # Save user message while the LLM request is in flight
+        user_message_task = run_in_background(
+            get_supabase().create_message,
             chat_id=chat_id,
             role="user",
             content=request.message
         )
         
-        # Get chat history
-        messages = get_supabase().get_chat_messages(chat_id, limit=20)
-        
-        # Get file context if file_ids provided
-        context = ""
-        if request.file_ids:
-            logger.info(f"📄 Loading context from {len(request.file_ids)} files")
-            context = await get_file_context(
-                file_ids=request.file_ids,
-                max_chars=10000
-            )
-            logger.info(f"✅ Context loaded: {len(context)} characters")
-        
-        # Build messages for LLM
-        llm_messages = []
-        
-        # System prompt - minimal and natural, let the model respond like ChatGPT
-        system_prompt = "You are a helpful AI assistant."
+        # Build messages for LLM. The static system prompt goes first as its
+        # own message so the prefix stays byte-identical across users and
+        # turns (OpenAI prompt caching keys on it); document context follows.
+        llm_messages = [SYSTEM_MESSAGE]
         
         if context:
-            system_prompt += f"\n\nDocument Context:\n{context}"
-        
-        llm_messages.append({
-            "role": "system",
-            "content": system_prompt
-        })
-        
-        # Add chat history
-        for msg in messages[:-1]:  # Exclude the message we just added
             llm_messages.append({
-                "role": msg["role"],
-                "content": msg["content"]
+                "role": "system",
+                "content": f"Document Context:\n{context}"
             })
         
+        # Add chat history
+        llm_messages.extend(
+            {"role": msg["role"], "content": msg["content"]} for msg in messages
+        )
+        
         # Add current user message
         llm_messages.append({
             "role": "user",
@@ -247,46 +597,161 @@ async def send_message(chat_id: str, request: ChatMessageRequest):
         
         # Stream response from OpenAI
         async def generate_stream():
-            """Generate SSE stream"""
-            full_response = ""
-            settings = get_settings()
+            """
+            Generate SSE stream
             
-            try:
-                logger.info(f"🤖 Streaming response from {settings.model_id}")
-                async for chunk in openai_stream(
-                    messages=llm_messages,
-                    model=settings.model_id,
-                    temperature=0.7,
-                    max_tokens=4096
-                ):
-                    # Forward the chunk (EventSourceResponse will add "data:" prefix)
-                    yield chunk
-                    
-                    # Extract content for saving
-                    if chunk != "[DONE]":
-                        try:
-                            data = json.loads(chunk)
-                            if "content" in data:
-                                full_response += data["content"]
-                        except:
-                            pass
-                
-                # Save assistant response
-                if full_response:
-                    logger.info(f"💾 Saving assistant response ({len(full_response)} chars)")
-                    get_supabase().create_message(
+            Content deltas are coalesced into batches that grow geometrically
+            (1 → 3 → 9 → ... up to STREAM_BATCH_MAX deltas) so the first token
+            is sent immediately and later frames carry more text. A pending
+            batch is also flushed once STREAM_FLUSH_INTERVAL has elapsed, even
+            if no further delta has arrived.
+            
+            The assistant message is persisted incrementally: the row is
+            created on the first flush and extended every MESSAGE_FLUSH_CHARS,
+            with each write chained after the previous one.
+            """
+            response_parts = []
+            pending = []
+            batch_size = 1
+            last_flush = time.monotonic()
+            
+            assistant_message_id = str(uuid.uuid4())
+            unsaved = []
+            unsaved_chars = 0
+            write_task = user_message_task
+            
+            def persist_unsaved():
+                """Queue a write of the not-yet-persisted response text"""
+                nonlocal unsaved_chars, write_task
+                text = "".join(unsaved)
+                unsaved.clear()
+                unsaved_chars = 0
+                if write_task is user_message_task:
+                    write_task = run_in_background(
+                        get_supabase().create_message,
                         chat_id=chat_id,
                         role="assistant",
-                        content=full_response
+                        content=text,
+                        message_id=assistant_message_id,
+                        after=write_task
+                    )
+                elif get_pool():
+                    write_task = run_in_background(
+                        append_message_content, assistant_message_id, text, after=write_task
                     )
-                    logger.info(f"✅ Response saved successfully")
+                else:
+                    write_task = run_in_background(
+                        get_supabase().update_message_content,
+                        assistant_message_id,
+                        "".join(response_parts),
+                        after=write_task
+                    )
+            
+            def content_event(text: str) -> ServerSentEvent:
+                """Build a content frame; EventSourceResponse adds the "data:" framing"""
+                return ServerSentEvent(data=orjson.dumps({"content": text}).decode())
+            
+            # Priming frame so the client receives its first byte immediately
+            yield content_event("")
+            
+            deltas = openai_stream(
+                messages=llm_messages,
+                model=SETTINGS.model_id,
+                temperature=0.7,
+                max_tokens=4096
+            ).__aiter__()
+            next_delta: Optional[asyncio.Future] = None
+            
+            try:
+                logger.info("🤖 Streaming response from %s", SETTINGS.model_id)
+                while True:
+                    # The read is kept as a task across waits: cancelling a
+                    # pending __anext__ would close the upstream generator
+                    if next_delta is None:
+                        next_delta = asyncio.ensure_future(deltas.__anext__())
+                    # With text buffered, wait only until it is due, so a
+                    # pause in generation doesn't hold it back
+                    timeout = None
+                    if pending:
+                        timeout = max(0.0, STREAM_FLUSH_INTERVAL - (time.monotonic() - last_flush))
+                    done, _ = await asyncio.wait({next_delta}, timeout=timeout)
+                    if not done:
+                        yield content_event("".join(pending))
+                        pending.clear()
+                        batch_size = min(batch_size * STREAM_BATCH_GROWTH, STREAM_BATCH_MAX)
+                        last_flush = time.monotonic()
+                        continue
+                    
+                    task, next_delta = next_delta, None
+                    try:
+                        delta = task.result()
+                    except StopAsyncIteration:
+                        break
+                    
+                    if delta.content:
+                        pending.append(delta.content)
+                        response_parts.append(delta.content)
+                        unsaved.append(delta.content)
+                        unsaved_chars += len(delta.content)
+                        if unsaved_chars >= MESSAGE_FLUSH_CHARS:
+                            persist_unsaved()
+                        now = time.monotonic()
+                        if len(pending) >= batch_size or now - last_flush >= STREAM_FLUSH_INTERVAL:
+                            yield content_event("".join(pending))
+                            pending.clear()
+                            batch_size = min(batch_size * STREAM_BATCH_GROWTH, STREAM_BATCH_MAX)
+                            last_flush = now
+                        continue
+                    
+                    # Flush buffered content before forwarding [DONE] or errors
+                    if pending:
+                        yield content_event("".join(pending))
+                        pending.clear()
+                    if delta.done:
+                        yield ServerSentEvent(data=delta.payload)
+                    else:
+                        yield ServerSentEvent(data=delta.payload, event="error")
+                
+                if pending:
+                    yield content_event("".join(pending))
+                
+                # Save the rest of the assistant response without holding the stream open
+                if unsaved:
+                    persist_unsaved()
+                if response_parts:
+                    logger.info("💾 Saving assistant response (%s chars)", sum(map(len, response_parts)))
+            
+            except asyncio.CancelledError:
+                # Client disconnected - keep whatever was generated so far
+                if unsaved:
+                    logger.warning("⚠️ Client disconnected, saving partial response")
+                    persist_unsaved()
+                raise
             
             except Exception as e:
                 error_msg = f"Stream error: {str(e)}"
-                logger.error(f"❌ Streaming error: {str(e)}")
-                yield f"data: {{'error': '{error_msg}'}}\n\n"
+                logger.error("❌ Streaming error: %s", e)
+                yield ServerSentEvent(
+                    data=orjson.dumps({"error": error_msg}).decode(),
+                    event="error"
+                )
+            
+            finally:
+                # Stop the upstream read if the stream ended early
+                if next_delta is not None:
+                    next_delta.cancel()
+                else:
+                    await deltas.aclose()
         
-        return EventSourceResponse(generate_stream())
+        # Keepalive pings stop proxies from dropping the connection while the
+        # model is slow to respond. An explicit Content-Encoding makes
+        # GZipMiddleware pass the stream through instead of buffering frames
+        # into compressed blocks.
+        return EventSourceResponse(
+            generate_stream(),
+            ping=15,
+            headers={"Content-Encoding": "identity"}
+        )
     
     except HTTPException:
         raise
@@ -304,29 +769,14 @@ async def sign_file_upload(request: FileSignRequest):
     Generate a signed URL for file upload to Supabase Storage
     """
     try:
-        settings = get_settings()
-        logger.info(f"📤 Signing upload for file: {request.filename}")
+        logger.info("📤 Signing upload for file: %s", request.filename)
         # Generate unique file path
         file_path = generate_file_path(request.user_id, request.filename)
         
-        # Create file record in database
-        file_record = get_supabase().create_file(
-            user_id=request.user_id,
-            filename=request.filename,
-            file_path=file_path,
-            mime_type=request.content_type,
-            chat_id=request.chat_id  # ✅ Link file to chat
-        )
-        
-        if not file_record:
-            logger.error("❌ Failed to create file record in database")
-            raise HTTPException(status_code=500, detail="Failed to create file record")
-        
-        logger.info(f"✅ File record created: {file_record['id']}")
-        
-        # Generate signed upload URL
+        # Generate signed upload URL first so the record is written once with
+        # the final storage path
         upload_response = get_supabase().get_signed_upload_url(
-            bucket=settings.bucket_legal,
+            bucket=BUCKET_LEGAL,
             path=file_path,
             expires_in=3600
         )
@@ -335,13 +785,25 @@ async def sign_file_upload(request: FileSignRequest):
         actual_path = upload_response.get("path", file_path)
         token = upload_response.get("token", "")
         
-        logger.info(f"✅ Upload URL generated")
-        logger.info(f"📍 Storage path: {actual_path}")
+        logger.info("✅ Upload URL generated")
+        logger.info("📍 Storage path: %s", actual_path)
+        
+        # Create file record in database
+        file_record = await asyncio.to_thread(
+            get_supabase().create_file,
+            user_id=request.user_id,
+            filename=request.filename,
+            file_path=actual_path,
+            mime_type=request.content_type,
+            chat_id=request.chat_id,  # ✅ Link file to chat
+            bucket=BUCKET_LEGAL
+        )
+        
+        if not file_record:
+            logger.error("❌ Failed to create file record in database")
+            raise HTTPException(status_code=500, detail="Failed to create file record")
         
-        # Update file record with actual storage path if different
-        if actual_path != file_path:
-            logger.info(f"⚠️ Path mismatch - updating file record")
-            get_supabase().client.table("files").update({"file_path": actual_path}).eq("id", file_record["id"]).execute()
+        logger.info("✅ File record created: %s", file_record['id'])
         
         return FileSignResponse(
             file_id=file_record["id"],
@@ -351,7 +813,7 @@ async def sign_file_upload(request: FileSignRequest):
         )
     
     except Exception as e:
-        logger.error(f"❌ File signing error: {str(e)}")
+        logger.error("❌ File signing error: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -361,9 +823,9 @@ async def ingest_file_route(request: FileIngestRequest):
     Extract text from uploaded file using OpenAI File Extraction API
     """
     try:
-        logger.info(f"🔍 Starting file ingestion for file_id: {request.file_id}")
+        logger.info("🔍 Starting file ingestion for file_id: %s", request.file_id)
         # Verify file exists
-        file_record = get_supabase().get_file(request.file_id)
+        file_record = await asyncio.to_thread(get_supabase().get_file, request.file_id)
         if not file_record:
             raise HTTPException(status_code=404, detail="File not found")
         
@@ -372,14 +834,14 @@ async def ingest_file_route(request: FileIngestRequest):
             raise HTTPException(status_code=403, detail="Unauthorized")
         
         # Process file using OpenAI File Extraction API
-        logger.info(f"🤖 Calling OpenAI to extract text from file")
+        logger.info("🤖 Calling OpenAI to extract text from file")
         result = await ingest_file(
             file_id=request.file_id,
             project_id=request.user_id
         )
         
         if result.get("success"):
-            logger.info(f"✅ File ingestion successful: {result.get('text_length', 0)} chars extracted")
+            logger.info("✅ File ingestion successful: %s chars extracted", result.get('text_length', 0))
             return FileIngestResponse(
                 file_id=result.get("file_id", request.file_id),
                 status="completed",
@@ -388,62 +850,69 @@ async def ingest_file_route(request: FileIngestRequest):
             )
         else:
             error_msg = result.get("error", "Unknown error")
-            logger.error(f"❌ File ingestion failed: {error_msg}")
+            logger.error("❌ File ingestion failed: %s", error_msg)
             raise HTTPException(status_code=500, detail=error_msg)
     
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"❌ File ingestion route error: {str(e)}")
+        logger.error("❌ File ingestion route error: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.get("/v1/files/{file_id}")
-async def get_file(file_id: str, admin_key: Optional[str] = Header(None, alias="X-Admin-Key")):
-    """Get file metadata and download URL"""
+async def get_file(
+    file_id: str,
+    sign: bool = False,
+    admin_key: Optional[str] = Header(None, alias="X-Admin-Key")
+):
+    """Get file metadata, plus a signed download URL when ?sign=1"""
     try:
-        logger.info(f"📄 Getting file metadata for: {file_id}")
-        file_record = get_supabase().get_file(file_id)
+        logger.info("📄 Getting file metadata for: %s", file_id)
+        file_record = await asyncio.to_thread(get_supabase().get_file, file_id)
         
         if not file_record:
-            logger.error(f"❌ File not found: {file_id}")
+            logger.error("❌ File not found: %s", file_id)
             raise HTTPException(status_code=404, detail="File not found")
         
+        if not sign:
+            return file_record
+        
         # Generate signed download URL
-        settings = get_settings()
         file_path = file_record.get("file_path")
+        bucket = file_record.get("bucket") or BUCKET_LEGAL
         
-        logger.info(f"📍 File path: {file_path}")
-        logger.info(f"📍 Bucket: {settings.bucket_legal}")
+        logger.info("📍 File path: %s", file_path)
+        logger.info("📍 Bucket: %s", bucket)
         
         if file_path:
             try:
-                logger.info(f"🔐 Generating signed URL for: {file_path}")
-                download_url = get_supabase().get_signed_download_url(
-                    bucket=settings.bucket_legal,
+                logger.info("🔐 Generating signed URL for: %s", file_path)
+                download_url = await get_signed_download_url_cached(
+                    bucket=bucket,
                     path=file_path,
                     expires_in=3600
                 )
                 
                 if download_url:
                     file_record["download_url"] = download_url
-                    logger.info(f"✅ Generated download URL successfully")
+                    logger.info("✅ Generated download URL successfully")
                 else:
-                    logger.error(f"❌ Empty download URL returned")
+                    logger.error("❌ Empty download URL returned")
                     
             except Exception as e:
-                logger.error(f"❌ Failed to generate download URL: {str(e)}")
+                logger.error("❌ Failed to generate download URL: %s", e)
                 logger.exception(e)
                 # Don't fail the request, just log the error
         else:
-            logger.warning(f"⚠️ No file_path in record")
+            logger.warning("⚠️ No file_path in record")
         
         return file_record
     
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"❌ Get file error: {str(e)}")
+        logger.error("❌ Get file error: %s", e)
         logger.exception(e)
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -452,61 +921,88 @@ async def get_file(file_id: str, admin_key: Optional[str] = Header(None, alias="
 async def get_file_chunks(file_id: str):
     """Get all chunks for a file"""
     try:
-        chunks = get_supabase().get_file_chunks(file_id)
+        chunks = await asyncio.to_thread(get_supabase().get_file_chunks, file_id)
         return {"chunks": chunks}
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+async def _delete_file_stepwise(file_id: str, user_id: str) -> Dict[str, Any]:
+    """
+    Delete a file's chunks and record one by one, for databases without delete_file_owned
+
+    Returns the file's storage location ({file_path, bucket}), like the SQL function.
+    """
+    # Get file record to verify ownership and get storage path
+    file_record = await asyncio.to_thread(get_supabase().get_file, file_id)
+    
+    if not file_record:
+        logger.error("❌ File not found: %s", file_id)
+        raise HTTPException(status_code=404, detail="File not found")
+    
+    # Verify ownership
+    if file_record.get("user_id") != user_id:
+        logger.error("❌ Unauthorized delete attempt: %s by %s", file_id, user_id)
+        raise HTTPException(status_code=403, detail="Unauthorized")
+    
+    # Delete file chunks (best-effort; CASCADE also covers them)
+    try:
+        await asyncio.to_thread(
+            get_supabase().client.table("file_chunks").delete().eq("file_id", file_id).execute
+        )
+        logger.info("✅ Deleted file chunks for: %s", file_id)
+    except Exception as chunk_error:
+        logger.warning("⚠️ Chunk deletion failed (continuing): %s", chunk_error)
+    
+    # Delete file record from database
+    await asyncio.to_thread(get_supabase().client.table("files").delete().eq("id", file_id).execute)
+    
+    return {"file_path": file_record.get("file_path"), "bucket": file_record.get("bucket")}
+
+
 @app.delete("/v1/files/{file_id}")
 async def delete_file(file_id: str, request: FileDeleteRequest):
     """
     Delete a file and its associated chunks from storage and database
     """
     try:
-        logger.info(f"🗑️ Deleting file: {file_id} by user: {request.user_id}")
+        logger.info("🗑️ Deleting file: %s by user: %s", file_id, request.user_id)
         
-        # Get file record to verify ownership and get storage path
-        file_record = get_supabase().get_file(file_id)
-        
-        if not file_record:
-            logger.error(f"❌ File not found: {file_id}")
-            raise HTTPException(status_code=404, detail="File not found")
-        
-        # Verify ownership
-        if file_record.get("user_id") != request.user_id:
-            logger.error(f"❌ Unauthorized delete attempt: {file_id} by {request.user_id}")
-            raise HTTPException(status_code=403, detail="Unauthorized")
-        
-        # Delete from storage
-        settings = get_settings()
-        file_path = file_record.get("file_path")
+        # Verify ownership and delete chunks and record in one transaction
+        try:
+            if get_pool():
+                deleted = await fetch_delete_file_owned(file_id, request.user_id)
+            else:
+                deleted = await asyncio.to_thread(
+                    get_supabase().delete_file_owned, file_id, request.user_id
+                )
+        except Exception as e:
+            _raise_for_ownership_error(e, "File not found", "Unauthorized")
+            # Function not deployed yet (migrations/008_delete_file_owned.sql)
+            logger.warning("⚠️ delete_file_owned not found, deleting file step by step")
+            deleted = await _delete_file_stepwise(file_id, request.user_id)
+        invalidate_file_context([file_id])
+        logger.info("✅ Deleted file record: %s", file_id)
         
+        # Delete from storage (best-effort)
+        file_path = deleted.get("file_path") if deleted else None
         if file_path:
             try:
-                storage_response = get_supabase().client.storage.from_(settings.bucket_legal).remove([file_path])
-                logger.info(f"✅ Deleted from storage: {file_path}")
+                await asyncio.to_thread(
+                    get_supabase().client.storage.from_(deleted.get("bucket") or BUCKET_LEGAL).remove,
+                    [file_path]
+                )
+                logger.info("✅ Deleted from storage: %s", file_path)
             except Exception as storage_error:
-                logger.warning(f"⚠️ Storage deletion failed (continuing): {storage_error}")
-        
-        # Delete file chunks first (due to foreign key constraint)
-        try:
-            get_supabase().client.table("file_chunks").delete().eq("file_id", file_id).execute()
-            logger.info(f"✅ Deleted file chunks for: {file_id}")
-        except Exception as chunk_error:
-            logger.warning(f"⚠️ Chunk deletion failed (continuing): {chunk_error}")
-        
-        # Delete file record from database
-        get_supabase().client.table("files").delete().eq("id", file_id).execute()
-        logger.info(f"✅ Deleted file record: {file_id}")
+                logger.warning("⚠️ Storage deletion failed (continuing): %s", storage_error)
         
         return {"success": True, "message": "File deleted successfully"}
     
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"❌ File deletion error: {str(e)}")
+        logger.error("❌ File deletion error: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -519,6 +1015,7 @@ async def admin_overview(x_admin_key: Optional[str] = Header(None)):
     """
     Get admin overview statistics
     Requires admin API key in X-Admin-Key header
+    Served from a snapshot that is recomputed when older than ADMIN_STATS_TTL seconds
     """
     if not verify_admin_key(x_admin_key):
         raise HTTPException(
@@ -527,7 +1024,7 @@ async def admin_overview(x_admin_key: Optional[str] = Header(None)):
         )
     
     try:
-        stats = get_supabase().get_admin_stats()
+        stats = await get_admin_stats_snapshot()
         return AdminOverviewResponse(**stats)
     
     except Exception as e:
@@ -542,7 +1039,7 @@ async def admin_overview(x_admin_key: Optional[str] = Header(None)):
 async def get_user_chats(user_id: str, limit: int = 50):
     """Get all chats for a user"""
     try:
-        chats = get_supabase().get_user_chats(user_id, limit=limit)
+        chats = await asyncio.to_thread(get_supabase().get_user_chats, user_id, limit=limit)
         return {"chats": chats}
     
     except Exception as e:
@@ -550,20 +1047,76 @@ async def get_user_chats(user_id: str, limit: int = 50):
 
 
 @app.get("/v1/users/{user_id}/files")
-async def get_user_files(user_id: str, limit: int = 50, chat_id: Optional[str] = None):
-    """Get all files for a user, optionally filtered by chat_id"""
+async def get_user_files(
+    user_id: str,
+    limit: int = 50,
+    chat_id: Optional[str] = None,
+    before: Optional[datetime] = None,
+    sign: bool = False
+):
+    """
+    Get a user's files newest first, optionally filtered by chat_id
+    Pass the last file's created_at as `before` for the next page; `sign` adds download URLs
+    """
     try:
-        files = get_supabase().get_user_files(user_id, limit=limit, chat_id=chat_id)
+        files = await asyncio.to_thread(
+            get_supabase().get_user_files,
+            user_id,
+            limit=limit,
+            chat_id=chat_id,
+            before=before.isoformat() if before else None
+        )
+        if sign:
+            await add_download_urls(files)
         return {"files": files}
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/v1/users/{user_id}/dashboard")
+async def get_user_dashboard(user_id: str, limit: int = 50):
+    """Get a user's latest chats and files in one call"""
+    try:
+        return await asyncio.to_thread(get_supabase().get_user_dashboard, user_id, limit=limit)
+    
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 # ============================================================================
 # ADMIN ROUTES
 # ============================================================================
 
+async def fetch_auth_users_concurrently(user_ids: list) -> dict:
+    """
+    Look up auth users one by one, ADMIN_LOOKUP_CONCURRENCY at a time.
+    Fallback for when the bulk admin listing is unavailable; rate-limited
+    (429) lookups are retried with exponential backoff.
+    """
+    semaphore = asyncio.Semaphore(ADMIN_LOOKUP_CONCURRENCY)
+    
+    async def fetch_one(user_id: str):
+        async with semaphore:
+            delay = 0.5
+            for attempt in range(3):
+                try:
+                    response = await asyncio.to_thread(
+                        get_supabase().client.auth.admin.get_user_by_id, user_id
+                    )
+                    return user_id, getattr(response, 'user', None)
+                except Exception as e:
+                    if getattr(e, 'status', None) == 429 and attempt < 2:
+                        await asyncio.sleep(delay)
+                        delay *= 2
+                        continue
+                    logger.error("❌ Error fetching user %s: %s", user_id, e)
+                    return user_id, None
+    
+    results = await asyncio.gather(*(fetch_one(user_id) for user_id in user_ids))
+    return {user_id: user for user_id, user in results if user}
+
+
 @app.get("/v1/admin/users")
 async def get_all_users(admin_key: str = Header(None, alias="X-Admin-Key")):
     """Get all users with their stats (admin only)"""
@@ -571,62 +1124,55 @@ async def get_all_users(admin_key: str = Header(None, alias="X-Admin-Key")):
         verify_admin_key(admin_key)
         logger.info("🔐 Admin: Fetching all users")
         
-        # Get unique user IDs from chats table
-        chats_response = get_supabase().client.table('chats').select('user_id').execute()
-        user_ids = list(set([chat['user_id'] for chat in chats_response.data])) if chats_response.data else []
+        # Single SQL aggregation joined with auth.users when direct SQL is configured
+        if get_pool():
+            user_data = await fetch_user_stats()
+            logger.info("✅ Returning %s users", len(user_data))
+            return {'users': user_data}
         
-        logger.info(f"📊 Found {len(user_ids)} unique users")
+        # Per-user counts from one grouped query
+        user_stats = await asyncio.to_thread(get_supabase().get_admin_user_stats)
+        user_ids = [stats['user_id'] for stats in user_stats]
+        logger.info("📊 Found %s unique users", len(user_ids))
+        
+        # Get user info from auth.users using admin API, all pages at once
+        try:
+            auth_users = await asyncio.to_thread(get_supabase().list_auth_users)
+        except Exception as list_error:
+            logger.error("❌ Error listing auth users, falling back to per-user lookups: %s", list_error)
+            auth_users = await fetch_auth_users_concurrently(user_ids)
         
         user_data = []
-        for user_id in user_ids:
-            # Get user info from auth.users using admin API
-            try:
-                user_response = get_supabase().client.auth.admin.get_user_by_id(user_id)
-                user = user_response.user if hasattr(user_response, 'user') else None
-                
-                if not user:
-                    continue
-                
-                # Get user's chat count
-                chats = get_supabase().client.table('chats').select('id').eq('user_id', user_id).execute()
-                chat_count = len(chats.data) if chats.data else 0
-                
-                # Get user's file count
-                files = get_supabase().client.table('files').select('id').eq('user_id', user_id).execute()
-                file_count = len(files.data) if files.data else 0
-                
+        for stats in user_stats:
+            user_id = stats['user_id']
+            user = auth_users.get(user_id)
+            if user:
                 user_data.append({
                     'id': user.id,
                     'email': user.email,
                     'created_at': user.created_at,
-                    'last_sign_in_at': user.last_sign_in_at if hasattr(user, 'last_sign_in_at') else None,
-                    'chat_count': chat_count,
-                    'file_count': file_count
+                    'last_sign_in_at': getattr(user, 'last_sign_in_at', None),
+                    'chat_count': stats['chat_count'],
+                    'file_count': stats['file_count']
                 })
-            except Exception as user_error:
-                logger.error(f"❌ Error fetching user {user_id}: {str(user_error)}")
+            else:
                 # Still include user with basic info
-                chats = get_supabase().client.table('chats').select('id, created_at').eq('user_id', user_id).execute()
-                chat_count = len(chats.data) if chats.data else 0
-                files = get_supabase().client.table('files').select('id').eq('user_id', user_id).execute()
-                file_count = len(files.data) if files.data else 0
-                
                 user_data.append({
                     'id': user_id,
                     'email': f'User {user_id[:8]}...',
-                    'created_at': chats.data[0]['created_at'] if chats.data else None,
+                    'created_at': stats['first_chat_at'],
                     'last_sign_in_at': None,
-                    'chat_count': chat_count,
-                    'file_count': file_count
+                    'chat_count': stats['chat_count'],
+                    'file_count': stats['file_count']
                 })
         
-        logger.info(f"✅ Returning {len(user_data)} users")
+        logger.info("✅ Returning %s users", len(user_data))
         return {'users': user_data}
     
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"❌ Admin users error: {str(e)}")
+        logger.error("❌ Admin users error: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -635,151 +1181,193 @@ async def get_user_chats_admin(user_id: str, admin_key: str = Header(None, alias
     """Get all chats for a specific user (admin only)"""
     try:
         verify_admin_key(admin_key)
-        chats = get_supabase().get_user_chats(user_id)
+        chats = await asyncio.to_thread(get_supabase().get_user_chats, user_id)
         return {'chats': chats}
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"❌ Admin user chats error: {str(e)}")
+        logger.error("❌ Admin user chats error: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/v1/admin/users/{user_id}/dashboard")
+async def get_user_dashboard_admin(user_id: str, admin_key: str = Header(None, alias="X-Admin-Key")):
+    """Get a specific user's chats and files in one call (admin only)"""
+    if not verify_admin_key(admin_key):
+        raise HTTPException(
+            status_code=403,
+            detail="Invalid or missing admin API key"
+        )
+    
+    try:
+        return await asyncio.to_thread(get_supabase().get_user_dashboard, user_id)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("❌ Admin user dashboard error: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.get("/v1/admin/users/{user_id}/files")
-async def get_user_files_admin(user_id: str, admin_key: str = Header(None, alias="X-Admin-Key")):
-    """Get all files for a specific user (admin only)"""
+async def get_user_files_admin(
+    user_id: str,
+    sign: bool = False,
+    admin_key: str = Header(None, alias="X-Admin-Key")
+):
+    """Get all files for a specific user (admin only); `sign` adds download URLs"""
+    if not verify_admin_key(admin_key):
+        raise HTTPException(
+            status_code=403,
+            detail="Invalid or missing admin API key"
+        )
+    
     try:
-        verify_admin_key(admin_key)
-        files = get_supabase().get_user_files(user_id)
+        files = await asyncio.to_thread(get_supabase().get_user_files, user_id)
+        if sign:
+            await add_download_urls(files)
         return {'files': files}
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"❌ Admin user files error: {str(e)}")
+        logger.error("❌ Admin user files error: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.get("/v1/admin/files")
-async def get_all_files_admin(admin_key: str = Header(None, alias="X-Admin-Key")):
-    """Get all files across all users (admin only)"""
+async def get_all_files_admin(sign: bool = False, admin_key: str = Header(None, alias="X-Admin-Key")):
+    """Get all files across all users (admin only); `sign` adds download URLs"""
+    if not verify_admin_key(admin_key):
+        raise HTTPException(
+            status_code=403,
+            detail="Invalid or missing admin API key"
+        )
+    
     try:
-        verify_admin_key(admin_key)
         # Query all files from database
-        response = get_supabase().client.table("files").select("*").order("created_at", desc=True).execute()
+        response = await asyncio.to_thread(
+            get_supabase().client.table("files").select("*").order("created_at", desc=True).execute
+        )
         files = response.data or []
-        logger.info(f"📁 Admin retrieved {len(files)} files")
+        logger.info("📁 Admin retrieved %s files", len(files))
+        if sign:
+            await add_download_urls(files)
         return {'files': files}
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"❌ Admin all files error: {str(e)}")
+        logger.error("❌ Admin all files error: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
+async def _delete_user_data_stepwise(user_id: str) -> List[Dict[str, Any]]:
+    """
+    Delete a user's app data table by table, for databases without delete_user_cascade
+
+    Returns the user's files ({file_id, file_path}), like the SQL function.
+    """
+    client = get_supabase().client
+    
+    async def run_delete(label: str, query) -> None:
+        """Execute one delete in a worker thread (best-effort)"""
+        try:
+            await asyncio.to_thread(query.execute)
+            logger.info("✅ Deleted %s", label)
+        except Exception as e:
+            logger.warning("⚠️ Failed to delete %s: %s", label, e)
+    
+    # Get all of the user's files and chats
+    user_files, user_chats = await asyncio.gather(
+        asyncio.to_thread(client.table("files").select("id, file_path").eq("user_id", user_id).execute),
+        asyncio.to_thread(client.table("chats").select("id").eq("user_id", user_id).execute)
+    )
+    user_files = user_files.data or []
+    chat_ids = [chat["id"] for chat in user_chats.data or []]
+    
+    # Children first, concurrently: file chunks, messages and profile are
+    # independent (CASCADE would handle chunks/messages, but being explicit)
+    await asyncio.gather(
+        run_delete("file chunks", client.table("file_chunks").delete().in_("file_id", [f["id"] for f in user_files])),
+        run_delete("messages", client.table("messages").delete().in_("chat_id", chat_ids)),
+        run_delete("profile", client.table("profiles").delete().eq("user_id", user_id))
+    )
+    
+    # Then the parent rows
+    await asyncio.gather(
+        run_delete("files from database", client.table("files").delete().eq("user_id", user_id)),
+        run_delete("chats", client.table("chats").delete().eq("user_id", user_id))
+    )
+    
+    return [{"file_id": f["id"], "file_path": f.get("file_path")} for f in user_files]
+
+
 @app.delete("/v1/admin/users/{user_id}")
 async def delete_user_admin(user_id: str, admin_key: str = Header(None, alias="X-Admin-Key")):
     """Delete a user and all their data (admin only)"""
     try:
         verify_admin_key(admin_key)
-        logger.info(f"🗑️ Admin deleting user: {user_id}")
+        logger.info("🗑️ Admin deleting user: %s", user_id)
         
         # Check if this is a placeholder/test user ID
         if user_id == "00000000-0000-0000-0000-000000000001" or user_id.startswith("00000000"):
-            logger.warning(f"⚠️ Detected placeholder user ID: {user_id}")
-            logger.warning(f"⚠️ This may be a test user or data inconsistency")
-        
-        settings = get_settings()
+            logger.warning("⚠️ Detected placeholder user ID: %s", user_id)
+            logger.warning("⚠️ This may be a test user or data inconsistency")
         
-        # Get user's files to delete from storage
-        user_files = get_supabase().get_user_files(user_id)
-        logger.info(f"📁 Found {len(user_files)} files to delete")
-        
-        # Delete files from storage
-        for file in user_files:
-            file_path = file.get("file_path")
-            if file_path:
-                try:
-                    get_supabase().client.storage.from_(settings.bucket_legal).remove([file_path])
-                    logger.info(f"✅ Deleted file from storage: {file_path}")
-                except Exception as e:
-                    logger.warning(f"⚠️ Failed to delete file from storage: {e}")
-        
-        # Delete file chunks (CASCADE should handle this, but being explicit)
+        # Delete chats, messages, files, chunks and profile in one transaction
         try:
-            get_supabase().client.table("file_chunks").delete().in_("file_id", [f["id"] for f in user_files]).execute()
-            logger.info(f"✅ Deleted file chunks")
+            if get_pool():
+                deleted_files = await fetch_delete_user_cascade(user_id)
+            else:
+                deleted_files = await asyncio.to_thread(get_supabase().delete_user_cascade, user_id)
+            logger.info("✅ Deleted user data")
         except Exception as e:
-            logger.warning(f"⚠️ Failed to delete file chunks: {e}")
+            if _error_code(e) not in MISSING_FUNCTION_CODES:
+                raise
+            # Function not deployed yet (migrations/006_delete_user_cascade.sql)
+            logger.warning("⚠️ delete_user_cascade not found, deleting user data step by step")
+            deleted_files = await _delete_user_data_stepwise(user_id)
+        logger.info("📁 Deleted %s files", len(deleted_files))
         
-        # Delete files from database
-        try:
-            get_supabase().client.table("files").delete().eq("user_id", user_id).execute()
-            logger.info(f"✅ Deleted files from database")
-        except Exception as e:
-            logger.warning(f"⚠️ Failed to delete files: {e}")
-        
-        # Delete messages (CASCADE from chats should handle this)
-        try:
-            get_supabase().client.table("messages").delete().in_(
-                "chat_id",
-                get_supabase().client.table("chats").select("id").eq("user_id", user_id).execute().data
-            ).execute()
-            logger.info(f"✅ Deleted messages")
-        except Exception as e:
-            logger.warning(f"⚠️ Failed to delete messages: {e}")
-        
-        # Delete chats
-        try:
-            get_supabase().client.table("chats").delete().eq("user_id", user_id).execute()
-            logger.info(f"✅ Deleted chats")
-        except Exception as e:
-            logger.warning(f"⚠️ Failed to delete chats: {e}")
-        
-        # Delete profile
-        try:
-            get_supabase().client.table("profiles").delete().eq("user_id", user_id).execute()
-            logger.info(f"✅ Deleted profile")
-        except Exception as e:
-            logger.warning(f"⚠️ Failed to delete profile: {e}")
+        # Delete files from storage (best-effort, batched remove requests)
+        await asyncio.to_thread(get_supabase().delete_storage_objects, deleted_files)
+        invalidate_file_context([f["file_id"] for f in deleted_files])
+        get_supabase().forget_chats()
         
         # Delete auth user (this is the main deletion)
         try:
             # Use the correct Supabase admin API method
-            from supabase import Client
-            response = get_supabase().client.auth.admin.delete_user(user_id)
-            logger.info(f"✅ Deleted auth user: {response}")
+            response = await asyncio.to_thread(get_supabase().client.auth.admin.delete_user, user_id)
+            logger.info("✅ Deleted auth user: %s", response)
         except AttributeError:
             # If admin API not available, try alternative method
             try:
-                logger.warning(f"⚠️ Admin API not available, using alternative deletion method")
+                logger.warning("⚠️ Admin API not available, using alternative deletion method")
                 # Delete using REST API directly
-                import requests
-                settings = get_settings()
-                url = f"{settings.supabase_url}/auth/v1/admin/users/{user_id}"
+                url = f"{SUPABASE_URL}/auth/v1/admin/users/{user_id}"
                 headers = {
-                    "apikey": settings.supabase_service_role_key,
-                    "Authorization": f"Bearer {settings.supabase_service_role_key}"
+                    "apikey": SUPABASE_SERVICE_KEY,
+                    "Authorization": f"Bearer {SUPABASE_SERVICE_KEY}"
                 }
-                response = requests.delete(url, headers=headers)
+                response = await get_admin_http_client().delete(url, headers=headers)
                 if response.status_code not in [200, 204]:
-                    logger.error(f"❌ Failed to delete auth user: {response.text}")
+                    logger.error("❌ Failed to delete auth user: %s", response.text)
                     raise Exception(f"Auth deletion failed: {response.text}")
-                logger.info(f"✅ Deleted auth user via REST API")
+                logger.info("✅ Deleted auth user via REST API")
             except Exception as alt_e:
-                logger.error(f"❌ Alternative deletion also failed: {alt_e}")
+                logger.error("❌ Alternative deletion also failed: %s", alt_e)
                 # Continue anyway - data is already deleted
-                logger.warning(f"⚠️ User data deleted but auth account may still exist")
+                logger.warning("⚠️ User data deleted but auth account may still exist")
         except Exception as e:
-            logger.error(f"❌ Failed to delete auth user: {e}")
+            logger.error("❌ Failed to delete auth user: %s", e)
             # Don't fail the entire operation - data is already deleted
-            logger.warning(f"⚠️ User data deleted but auth account may still exist")
+            logger.warning("⚠️ User data deleted but auth account may still exist")
         
-        logger.info(f"✅ User {user_id} deleted successfully")
+        logger.info("✅ User %s deleted successfully", user_id)
         return {"success": True, "message": "User deleted successfully"}
         
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"❌ Admin delete user error: {str(e)}")
+        logger.error("❌ Admin delete user error: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -788,12 +1376,12 @@ async def get_chat_messages_admin(chat_id: str, admin_key: str = Header(None, al
     """Get all messages in a chat (admin only)"""
     try:
         verify_admin_key(admin_key)
-        messages = get_supabase().get_chat_messages(chat_id)
+        messages = await asyncio.to_thread(get_supabase().get_chat_messages, chat_id)
         return {'messages': messages}
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"❌ Admin chat messages error: {str(e)}")
+        logger.error("❌ Admin chat messages error: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -826,7 +1414,7 @@ if __name__ == "__main__":
     args = parser.parse_args()
 
     if args.test_gpt5:
-        ok = test_gpt5_connection()
+        ok = asyncio.run(test_gpt5_connection())
         if ok:
             print("GPT-5 available ✅")
         else:
@@ -0,0 +1,70 @@
+"""
+HTTP middleware for conditional GET (ETag / If-None-Match) on JSON reads
+"""
+import hashlib
+import re
+from typing import Pattern
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+
+# File metadata and file/chat listings polled by the dashboards
+ETAG_PATHS = re.compile(
+    r"^/v1/(files/[^/]+|users/[^/]+/(chats|files|dashboard)|admin/files|admin/users/[^/]+/(chats|files|dashboard))$"
+)
+
+
+class ETagMiddleware:
+    """
+    Add a weak ETag to matching GET responses and answer 304 when the
+    client's If-None-Match already has it
+
+    Responses are marked `private, no-cache`: clients always revalidate
+    (the data changes right after the user's own uploads and deletes), but
+    an unchanged body costs a 304 instead of a full download and re-parse.
+    Implemented as plain ASGI so streaming routes are passed through untouched.
+    """
+
+    def __init__(self, app: ASGIApp, paths: Pattern = ETAG_PATHS, cache_control: str = "private, no-cache"):
+        self.app = app
+        self.paths = paths
+        self.cache_control = cache_control
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] != "GET" or not self.paths.match(scope["path"]):
+            await self.app(scope, receive, send)
+            return
+
+        start_message: Message = {}
+        body_parts = []
+
+        async def buffer(message: Message) -> None:
+            nonlocal start_message
+            if message["type"] == "http.response.start":
+                start_message = message
+            elif message["type"] == "http.response.body":
+                body_parts.append(message.get("body", b""))
+
+        await self.app(scope, receive, buffer)
+        body = b"".join(body_parts)
+
+        if start_message.get("status") != 200:
+            await send(start_message)
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        etag = f'W/"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+        headers = MutableHeaders(scope=start_message)
+        headers["ETag"] = etag
+        headers["Cache-Control"] = self.cache_control
+
+        if_none_match = Headers(scope=scope).get("if-none-match", "")
+        if etag in (tag.strip() for tag in if_none_match.split(",")):
+            del headers["content-length"]
+            del headers["content-type"]
+            start_message["status"] = 304
+            body = b""
+
+        await send(start_message)
+        await send({"type": "http.response.body", "body": body})
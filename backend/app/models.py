@@ -2,25 +2,29 @@
 Pydantic models for request/response validation
 """
 from datetime import datetime
-from typing import Optional, List, Dict, Any
-from uuid import UUID
+from typing import Annotated, Optional, List, Dict, Any
 
-from pydantic import BaseModel, Field, validator
+from pydantic import BaseModel, ConfigDict, Field, StringConstraints
+
+
+# Canonical 8-4-4-4-12 hex UUID kept as a string (handlers compare it with
+# Supabase's string IDs). The pattern is checked by pydantic-core in Rust.
+UUID_PATTERN = r"^[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}$"
+UUIDStr = Annotated[str, StringConstraints(strip_whitespace=True, pattern=UUID_PATTERN)]
+
+# Identifiers and names are stripped; free text (message bodies) is kept verbatim
+StrippedStr = Annotated[str, StringConstraints(strip_whitespace=True)]
+
+
+class RequestModel(BaseModel):
+    """Base for request bodies: unknown keys are dropped, instances immutable"""
+    model_config = ConfigDict(extra="ignore", frozen=True)
 
 
 # Chat Models
-class ChatCreate(BaseModel):
-    user_id: str
-    title: Optional[str] = None
-    
-    @validator('user_id')
-    def validate_user_id(cls, v):
-        """Validate that user_id is a valid UUID"""
-        try:
-            UUID(v)
-            return v
-        except ValueError:
-            raise ValueError(f'user_id must be a valid UUID, got: {v}')
+class ChatCreate(RequestModel):
+    user_id: UUIDStr
+    title: Optional[StrippedStr] = None
 
 
 class ChatResponse(BaseModel):
@@ -32,8 +36,8 @@ class ChatResponse(BaseModel):
 
 
 # Message Models
-class MessageCreate(BaseModel):
-    role: str = Field(..., pattern="^(user|assistant|system)$")
+class MessageCreate(RequestModel):
+    role: StrippedStr = Field(..., pattern="^(user|assistant|system)$")
     content: str
 
 
@@ -46,37 +50,19 @@ class MessageResponse(BaseModel):
     metadata: Optional[Dict[str, Any]] = {}
 
 
-class ChatMessageRequest(BaseModel):
+class ChatMessageRequest(RequestModel):
     message: str
-    user_id: str
-    file_ids: Optional[List[str]] = []
+    user_id: UUIDStr
+    file_ids: Optional[List[StrippedStr]] = []
     stream: bool = True
-    
-    @validator('user_id')
-    def validate_user_id(cls, v):
-        """Validate that user_id is a valid UUID"""
-        try:
-            UUID(v)
-            return v
-        except ValueError:
-            raise ValueError(f'user_id must be a valid UUID, got: {v}')
 
 
 # File Models
-class FileSignRequest(BaseModel):
-    filename: str
-    content_type: str
-    user_id: str
-    chat_id: Optional[str] = None  # ✅ Link files to chats
-    
-    @validator('user_id')
-    def validate_user_id(cls, v):
-        """Validate that user_id is a valid UUID"""
-        try:
-            UUID(v)
-            return v
-        except ValueError:
-            raise ValueError(f'user_id must be a valid UUID, got: {v}')
+class FileSignRequest(RequestModel):
+    filename: StrippedStr
+    content_type: StrippedStr
+    user_id: UUIDStr
+    chat_id: Optional[StrippedStr] = None  # ✅ Link files to chats
 
 
 class FileSignResponse(BaseModel):
@@ -86,19 +72,10 @@ class FileSignResponse(BaseModel):
     token: Optional[str] = None  # API key for direct upload
 
 
-class FileIngestRequest(BaseModel):
-    file_id: str
-    user_id: str
-    chat_id: Optional[str] = None
-    
-    @validator('user_id')
-    def validate_user_id(cls, v):
-        """Validate that user_id is a valid UUID"""
-        try:
-            UUID(v)
-            return v
-        except ValueError:
-            raise ValueError(f'user_id must be a valid UUID, got: {v}')
+class FileIngestRequest(RequestModel):
+    file_id: StrippedStr
+    user_id: UUIDStr
+    chat_id: Optional[StrippedStr] = None
 
 
 class FileIngestResponse(BaseModel):
@@ -108,17 +85,8 @@ class FileIngestResponse(BaseModel):
     message: str
 
 
-class FileDeleteRequest(BaseModel):
-    user_id: str
-    
-    @validator('user_id')
-    def validate_user_id(cls, v):
-        """Validate that user_id is a valid UUID"""
-        try:
-            UUID(v)
-            return v
-        except ValueError:
-            raise ValueError(f'user_id must be a valid UUID, got: {v}')
+class FileDeleteRequest(RequestModel):
+    user_id: UUIDStr
 
 
 class FileResponse(BaseModel):
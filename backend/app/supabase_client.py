@@ -1,31 +1,156 @@
 """
 Supabase client and database operations
 """
-from typing import Optional, List, Dict, Any
+import copy
+import logging
+import threading
+from typing import Optional, List, Dict, Any, Callable, Iterator
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from supabase import create_client, Client
-from app.utils import get_settings
+from urllib.parse import quote
+
+import httpx
+import orjson
+from cachetools import TTLCache
+from postgrest.exceptions import APIError
+from postgrest.types import ReturnMethod
+from supabase import create_client, Client, ClientOptions
+from app.utils import SUPABASE_URL, SUPABASE_SERVICE_KEY, BUCKETS
+
+logger = logging.getLogger(__name__)
+
+# Max paths per Storage remove request
+STORAGE_REMOVE_BATCH = 100
+
+# Max rows per bulk file_chunks insert request
+CHUNK_INSERT_BATCH = 500
+
+# Read size when streaming storage downloads, in bytes
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+# HTTP timeouts for PostgREST and Storage calls, in seconds
+POSTGREST_TIMEOUT = 10
+POSTGREST_CONNECT_TIMEOUT = 2
+STORAGE_TIMEOUT = 30
+
+# Idle keep-alive sockets are kept this long before being closed, in seconds
+KEEPALIVE_EXPIRY = 60
+
+# Chat, file and chunk reads are cached per process and dropped on this
+# process's writes. Other workers/instances don't see those invalidations, so
+# the TTLs are kept to a few seconds: a chat or file deleted elsewhere may be
+# served for at most that long, which is accepted. The cache still absorbs
+# the repeated reads within a request burst (e.g. one chat turn).
+RECORD_CACHE_TTL = 5
+CHUNK_CACHE_TTL = 5
+
+# Default column lists for hot reads; pass columns="*" for everything
+MESSAGE_COLUMNS = "id,chat_id,role,content,created_at"
+CHUNK_COLUMNS = "id,chunk_index,content,page_number"
+
+
+def _decode_json_with_orjson(response: httpx.Response) -> None:
+    """
+    httpx response hook: parse this response's JSON body with orjson
+
+    PostgREST results (chunk and message lists in particular) can be large;
+    orjson parses them several times faster than the stdlib json module.
+    orjson.JSONDecodeError subclasses json.JSONDecodeError, so callers'
+    error handling is unchanged.
+    """
+    response.json = lambda **kwargs: orjson.loads(response.content)
 
 
 class SupabaseClient:
     """Wrapper for Supabase operations"""
     
     def __init__(self):
-        import logging
-        logger = logging.getLogger(__name__)
-        settings = get_settings()
-        
         # Debug logging
-        logger.info(f"Supabase URL: {settings.supabase_url}")
-        logger.info(f"Service key length: {len(settings.supabase_service_role_key) if settings.supabase_service_role_key else 0}")
+        logger.info("Supabase URL: %s", SUPABASE_URL)
+        logger.info("Service key length: %s", len(SUPABASE_SERVICE_KEY))
         
-        # Strip whitespace from service key (important for secrets from GCP Secret Manager)
-        service_key = settings.supabase_service_role_key.strip() if settings.supabase_service_role_key else ""
+        service_key = SUPABASE_SERVICE_KEY
         
         self.client: Client = create_client(
-            settings.supabase_url,
-            service_key
+            SUPABASE_URL,
+            service_key,
+            options=ClientOptions(
+                postgrest_client_timeout=POSTGREST_TIMEOUT,
+                storage_client_timeout=STORAGE_TIMEOUT
+            )
         )
+        self._configure_postgrest_pool()
+        
+        # Streaming downloads and batch signing go straight to the Storage REST API
+        self._storage_url = f"{SUPABASE_URL}/storage/v1"
+        self._storage_http = httpx.Client(
+            headers={"apikey": service_key, "Authorization": f"Bearer {service_key}"},
+            timeout=STORAGE_TIMEOUT,
+            follow_redirects=True
+        )
+        
+        # Methods run in worker threads, so cache access is locked
+        self._cache_lock = threading.Lock()
+        self._chat_cache: TTLCache = TTLCache(maxsize=2048, ttl=RECORD_CACHE_TTL)
+        self._file_cache: TTLCache = TTLCache(maxsize=2048, ttl=RECORD_CACHE_TTL)
+        self._chunk_cache: TTLCache = TTLCache(maxsize=256, ttl=CHUNK_CACHE_TTL)
+    
+    def _configure_postgrest_pool(self) -> None:
+        """
+        Swap PostgREST's default HTTP session for one with an explicit
+        keep-alive pool and connect retries, so sockets are reused across
+        requests instead of paying a TLS handshake under load. HTTP/2 is
+        offered via ALPN, so concurrent calls from worker threads can share
+        one connection.
+        """
+        postgrest = self.client.postgrest
+        session = postgrest.session
+        postgrest.session = httpx.Client(
+            base_url=session.base_url,
+            headers=session.headers,
+            timeout=httpx.Timeout(POSTGREST_TIMEOUT, connect=POSTGREST_CONNECT_TIMEOUT),
+            follow_redirects=session.follow_redirects,
+            event_hooks={"response": [_decode_json_with_orjson]},
+            transport=httpx.HTTPTransport(
+                http2=True,
+                retries=2,
+                limits=httpx.Limits(
+                    max_connections=100,
+                    max_keepalive_connections=50,
+                    keepalive_expiry=KEEPALIVE_EXPIRY
+                )
+            )
+        )
+        session.close()
+    
+    # Read caches
+    def _cached(self, cache: TTLCache, key: str, load: Callable[[], Any]) -> Any:
+        """Return a copy of the cached value for key, loading it on a miss (None is not cached)"""
+        with self._cache_lock:
+            value = cache.get(key)
+        if value is None:
+            value = load()
+            if value is None:
+                return None
+            with self._cache_lock:
+                cache[key] = value
+        return copy.copy(value)
+    
+    def forget_chats(self, chat_ids: Optional[List[str]] = None) -> None:
+        """Drop cached chats (all of them when chat_ids is None)"""
+        with self._cache_lock:
+            if chat_ids is None:
+                self._chat_cache.clear()
+            for chat_id in chat_ids or ():
+                self._chat_cache.pop(chat_id, None)
+    
+    def forget_files(self, file_ids: List[str]) -> None:
+        """Drop cached file records and chunks"""
+        with self._cache_lock:
+            for file_id in file_ids:
+                self._file_cache.pop(file_id, None)
+                self._chunk_cache.pop(file_id, None)
     
     # Chat operations
     def create_chat(self, user_id: str, title: Optional[str] = None) -> Dict[str, Any]:
@@ -39,12 +164,15 @@ class SupabaseClient:
     
     def get_chat(self, chat_id: str) -> Optional[Dict[str, Any]]:
         """Get a chat by ID"""
-        response = self.client.table("chats").select("*").eq("id", chat_id).execute()
-        return response.data[0] if response.data else None
+        def load():
+            response = self.client.table("chats").select("*").eq("id", chat_id).execute()
+            return response.data[0] if response.data else None
+        return self._cached(self._chat_cache, chat_id, load)
     
     def update_chat(self, chat_id: str, title: str) -> Dict[str, Any]:
         """Update chat title"""
         response = self.client.table("chats").update({"title": title}).eq("id", chat_id).execute()
+        self.forget_chats([chat_id])
         return response.data[0] if response.data else None
     
     def get_user_chats(self, user_id: str, limit: int = 50) -> List[Dict[str, Any]]:
@@ -59,35 +187,111 @@ class SupabaseClient:
         )
         return response.data or []
     
+    def get_user_dashboard(self, user_id: str, limit: int = 50) -> Dict[str, List[Dict[str, Any]]]:
+        """Get a user's latest chats and files ({chats, files}) in one call"""
+        try:
+            return self.client.rpc(
+                "user_dashboard",
+                {"p_user_id": user_id, "p_limit": limit}
+            ).execute().data
+        except APIError as e:
+            if e.code != "PGRST202":
+                raise
+            # Function not deployed yet (migrations/012_user_dashboard.sql)
+            return {
+                "chats": self.get_user_chats(user_id, limit=limit),
+                "files": self.get_user_files(user_id, limit=limit)
+            }
+    
     # Message operations
     def create_message(
         self, 
         chat_id: str, 
         role: str, 
         content: str,
-        metadata: Optional[Dict[str, Any]] = None
+        metadata: Optional[Dict[str, Any]] = None,
+        message_id: Optional[str] = None
     ) -> Dict[str, Any]:
-        """Create a new message"""
+        """Create a new message (optionally with a caller-chosen ID)"""
+        try:
+            response = self.client.rpc(
+                "insert_message",
+                {
+                    "p_chat_id": chat_id,
+                    "p_role": role,
+                    "p_content": content,
+                    "p_metadata": metadata or {},
+                    "p_id": message_id
+                }
+            ).execute()
+            # A function returning a single row comes back as an object
+            return response.data[0] if isinstance(response.data, list) else response.data
+        except APIError as e:
+            if e.code != "PGRST202":
+                raise
+        
+        # Function not deployed yet (migrations/013_insert_message.sql)
         data = {
             "chat_id": chat_id,
             "role": role,
             "content": content,
             "metadata": metadata or {}
         }
+        if message_id:
+            data["id"] = message_id
         response = self.client.table("messages").insert(data).execute()
         return response.data[0] if response.data else None
     
-    def get_chat_messages(self, chat_id: str, limit: int = 100) -> List[Dict[str, Any]]:
-        """Get all messages for a chat"""
-        response = (
+    def update_message_content(self, message_id: str, content: str) -> None:
+        """Replace a message's content"""
+        self.client.table("messages").update({"content": content}).eq("id", message_id).execute()
+    
+    def get_chat_messages(
+        self,
+        chat_id: str,
+        limit: int = 100,
+        before: Optional[str] = None,
+        columns: str = MESSAGE_COLUMNS,
+        after: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Get the most recent messages for a chat in chronological order
+        
+        Args:
+            chat_id: Chat to read
+            limit: Maximum number of (newest) messages to return
+            before: Optional ISO timestamp; only messages created earlier are returned
+            columns: PostgREST column list to return
+            after: Optional ISO timestamp of the last message the caller has;
+                returns up to `limit` messages created after it, oldest first
+        """
+        query = (
             self.client.table("messages")
-            .select("*")
+            .select(columns)
             .eq("chat_id", chat_id)
-            .order("created_at", desc=False)
+        )
+        if before:
+            query = query.lt("created_at", before)
+        
+        if after:
+            # Page forward from the caller's newest message
+            response = (
+                query
+                .gt("created_at", after)
+                .order("created_at", desc=False)
+                .limit(limit)
+                .execute()
+            )
+            return response.data or []
+        
+        # Take the newest `limit` rows server-side, then restore oldest-first order
+        response = (
+            query
+            .order("created_at", desc=True)
             .limit(limit)
             .execute()
         )
-        return response.data or []
+        return list(reversed(response.data or []))
     
     # File operations
     def create_file(
@@ -97,7 +301,8 @@ class SupabaseClient:
         file_path: str,
         file_size: Optional[int] = None,
         mime_type: Optional[str] = None,
-        chat_id: Optional[str] = None
+        chat_id: Optional[str] = None,
+        bucket: Optional[str] = None
     ) -> Dict[str, Any]:
         """Create a file record"""
         data = {
@@ -109,13 +314,31 @@ class SupabaseClient:
             "chat_id": chat_id,
             "status": "pending"
         }
-        response = self.client.table("files").insert(data).execute()
+        if bucket:
+            data["bucket"] = bucket
+        try:
+            response = self.client.table("files").insert(data).execute()
+        except APIError as e:
+            if e.code != "PGRST204" or "bucket" not in data:
+                raise
+            # Column not added yet (migrations/010_files_bucket.sql)
+            del data["bucket"]
+            response = self.client.table("files").insert(data).execute()
         return response.data[0] if response.data else None
     
     def get_file(self, file_id: str) -> Optional[Dict[str, Any]]:
         """Get a file by ID"""
-        response = self.client.table("files").select("*").eq("id", file_id).execute()
-        return response.data[0] if response.data else None
+        def load():
+            response = self.client.table("files").select("*").eq("id", file_id).execute()
+            return response.data[0] if response.data else None
+        return self._cached(self._file_cache, file_id, load)
+    
+    def get_files_by_ids(self, file_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Get multiple files in a single query, keyed by file ID"""
+        if not file_ids:
+            return {}
+        response = self.client.table("files").select("*").in_("id", file_ids).execute()
+        return {f["id"]: f for f in response.data or []}
     
     def update_file_status(
         self, 
@@ -128,10 +351,23 @@ class SupabaseClient:
         if processed_at:
             data["processed_at"] = processed_at.isoformat()
         response = self.client.table("files").update(data).eq("id", file_id).execute()
+        self.forget_files([file_id])
         return response.data[0] if response.data else None
     
-    def get_user_files(self, user_id: str, limit: int = 50, chat_id: Optional[str] = None) -> List[Dict[str, Any]]:
-        """Get all files for a user, optionally filtered by chat_id"""
+    def get_user_files(
+        self,
+        user_id: str,
+        limit: int = 50,
+        chat_id: Optional[str] = None,
+        before: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Get a user's files newest first, optionally filtered by chat_id
+        
+        Args:
+            before: Optional ISO timestamp for keyset pagination; only files
+                created earlier are returned
+        """
         query = (
             self.client.table("files")
             .select("*")
@@ -140,6 +376,8 @@ class SupabaseClient:
         
         if chat_id:
             query = query.eq("chat_id", chat_id)
+        if before:
+            query = query.lt("created_at", before)
         
         response = (
             query
@@ -164,12 +402,14 @@ class SupabaseClient:
         if not file_ids:
             return
         self.client.table("file_chunks").delete().in_("file_id", file_ids).execute()
+        self.forget_files(file_ids)
 
     def delete_file_records_by_ids(self, file_ids: List[str]) -> None:
         """Delete files rows for given file IDs"""
         if not file_ids:
             return
         self.client.table("files").delete().in_("id", file_ids).execute()
+        self.forget_files(file_ids)
 
     def delete_messages_by_chat(self, chat_id: str) -> None:
         """Delete all messages in a chat"""
@@ -178,6 +418,50 @@ class SupabaseClient:
     def delete_chat(self, chat_id: str) -> None:
         """Delete chat row"""
         self.client.table("chats").delete().eq("id", chat_id).execute()
+        self.forget_chats([chat_id])
+
+    def delete_chat_cascade(self, chat_id: str, user_id: str) -> List[Dict[str, Any]]:
+        """
+        Delete a chat and its messages, chunks and file records in one transaction
+
+        Returns the deleted files ({file_id, file_path, bucket}) so their storage
+        objects can be removed. Raises APIError with code P0002 if the chat
+        does not exist and 42501 if it belongs to another user.
+        """
+        response = self.client.rpc(
+            "delete_chat_cascade",
+            {"p_chat_id": chat_id, "p_user_id": user_id}
+        ).execute()
+        self.forget_chats([chat_id])
+        self.forget_files([f["file_id"] for f in response.data or []])
+        return response.data or []
+    
+    def delete_file_owned(self, file_id: str, user_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Delete a file record and its chunks in one transaction, if owned by user_id
+
+        Returns the file's storage location ({file_path, bucket}). Raises APIError
+        with code P0002 if the file does not exist and 42501 if it belongs to
+        another user.
+        """
+        response = self.client.rpc(
+            "delete_file_owned",
+            {"p_file_id": file_id, "p_user_id": user_id}
+        ).execute()
+        self.forget_files([file_id])
+        return response.data[0] if response.data else None
+    
+    def delete_user_cascade(self, user_id: str) -> List[Dict[str, Any]]:
+        """
+        Delete all of a user's chats, messages, files, chunks and profile in one transaction
+
+        Returns the deleted files ({file_id, file_path, bucket}) so their storage
+        objects can be removed. The auth account is not touched.
+        """
+        response = self.client.rpc("delete_user_cascade", {"p_user_id": user_id}).execute()
+        self.forget_chats()
+        self.forget_files([f["file_id"] for f in response.data or []])
+        return response.data or []
     
     # File chunk operations
     def create_file_chunk(
@@ -197,148 +481,269 @@ class SupabaseClient:
             "metadata": metadata or {}
         }
         response = self.client.table("file_chunks").insert(data).execute()
+        self.forget_files([file_id])
         return response.data[0] if response.data else None
     
-    def get_file_chunks(self, file_id: str) -> List[Dict[str, Any]]:
-        """Get all chunks for a file"""
-        response = (
-            self.client.table("file_chunks")
-            .select("*")
-            .eq("file_id", file_id)
-            .order("chunk_index", desc=False)
-            .execute()
-        )
-        return response.data or []
+    def create_file_chunks(self, file_id: str, chunks: List[Dict[str, Any]]) -> None:
+        """
+        Insert a file's chunks in bulk, CHUNK_INSERT_BATCH rows per request
+
+        Each chunk is a dict with `content` and optional `page_number` and
+        `metadata`; chunk_index is its position in the list. Inserted rows
+        are not sent back.
+        """
+        rows = [
+            {
+                "file_id": file_id,
+                "chunk_index": i,
+                "content": chunk["content"],
+                "page_number": chunk.get("page_number"),
+                "metadata": chunk.get("metadata") or {}
+            }
+            for i, chunk in enumerate(chunks)
+        ]
+        for start in range(0, len(rows), CHUNK_INSERT_BATCH):
+            self.client.table("file_chunks").insert(
+                rows[start:start + CHUNK_INSERT_BATCH],
+                returning=ReturnMethod.minimal
+            ).execute()
+        self.forget_files([file_id])
     
-    def get_chunks_by_file_ids(self, file_ids: List[str]) -> List[Dict[str, Any]]:
-        """Get chunks for multiple files"""
-        response = (
+    def get_file_chunks(self, file_id: str, columns: str = CHUNK_COLUMNS) -> List[Dict[str, Any]]:
+        """Get all chunks for a file (only the default columns are cached)"""
+        def load():
+            response = (
+                self.client.table("file_chunks")
+                .select(columns)
+                .eq("file_id", file_id)
+                .order("chunk_index", desc=False)
+                .execute()
+            )
+            return response.data or []
+        if columns != CHUNK_COLUMNS:
+            return load()
+        return self._cached(self._chunk_cache, file_id, load)
+    
+    def get_chunks_by_file_ids(
+        self,
+        file_ids: List[str],
+        limit: Optional[int] = None,
+        offset: int = 0
+    ) -> List[Dict[str, Any]]:
+        """Get chunks for multiple files, optionally one `limit`-sized page by chunk index"""
+        query = (
             self.client.table("file_chunks")
-            .select("*")
+            .select("file_id,chunk_index,content")
             .in_("file_id", file_ids)
             .order("chunk_index", desc=False)
-            .execute()
+            .order("file_id", desc=False)
         )
+        if limit:
+            query = query.range(offset, offset + limit - 1)
+        response = query.execute()
         return response.data or []
     
     # Storage operations
     def get_signed_upload_url(self, bucket: str, path: str, expires_in: int = 3600) -> dict:
         """Generate a signed URL for file upload"""
-        import logging
-        import urllib.parse
-        logger = logging.getLogger(__name__)
-        
-        # Get base URL from settings
-        settings = get_settings()
-        base_url = settings.supabase_url.rstrip('/')
-        
-        # URL encode the path for proper handling of special characters
-        # Encode each segment separately to preserve slashes
-        path_segments = path.split('/')
-        encoded_segments = [urllib.parse.quote(segment, safe='') for segment in path_segments]
-        encoded_path = '/'.join(encoded_segments)
+        # URL encode the path for proper handling of special characters,
+        # keeping the slashes between segments
+        encoded_path = quote(path, safe='/')
         
         # Supabase Storage API endpoint format: /storage/v1/object/{bucket}/{path}
         # Note: This uses PUT method for direct uploads
-        upload_url = f"{base_url}/storage/v1/object/{bucket}/{encoded_path}"
+        upload_url = f"{SUPABASE_URL}/storage/v1/object/{bucket}/{encoded_path}"
         
-        logger.info(f"📍 Generated upload URL: {upload_url}")
-        logger.info(f"📍 Original path: {path}")
-        logger.info(f"📍 Encoded path: {encoded_path}")
-        logger.info(f"📍 Base URL: {base_url}")
-        logger.info(f"📍 Bucket: {bucket}")
+        logger.debug("📍 Generated upload URL: %s (path: %s, bucket: %s)", upload_url, path, bucket)
         
         # For direct uploads, we need the service role key for authentication
         # In production, consider using signed upload URLs instead
-        service_role_key = settings.supabase_service_role_key
-        
         return {
             "signedURL": upload_url,
             "path": path,
-            "token": service_role_key  # Service role key for authenticated upload
+            "token": SUPABASE_SERVICE_KEY  # Service role key for authenticated upload
         }
     
     def get_signed_download_url(self, bucket: str, path: str, expires_in: int = 3600) -> str:
         """Generate a signed URL for file download"""
-        import logging
-        logger = logging.getLogger(__name__)
-        
         try:
-            logger.info(f"🔐 Creating signed URL for bucket='{bucket}', path='{path}'")
+            logger.info("🔐 Creating signed URL for bucket='%s', path='%s'", bucket, path)
             response = self.client.storage.from_(bucket).create_signed_url(path, expires_in)
             
-            logger.info(f"📦 Supabase response: {response}")
+            logger.info("📦 Supabase response: %s", response)
             
             # Handle different response formats
             if isinstance(response, dict):
                 signed_url = response.get("signedURL") or response.get("signed_url")
                 if signed_url:
-                    logger.info(f"✅ Signed URL created successfully")
+                    logger.info("✅ Signed URL created successfully")
                     return signed_url
                 else:
-                    logger.error(f"❌ No signedURL in response: {response}")
+                    logger.error("❌ No signedURL in response: %s", response)
                     return ""
             else:
-                logger.error(f"❌ Unexpected response type: {type(response)}")
+                logger.error("❌ Unexpected response type: %s", type(response))
                 return ""
                 
         except Exception as e:
-            logger.error(f"❌ Error creating signed URL: {str(e)}")
+            logger.error("❌ Error creating signed URL: %s", e)
             logger.exception(e)
             raise
     
-    def download_file(self, bucket: str, path: str) -> bytes:
-        """Download file from storage"""
-        import logging
-        logger = logging.getLogger(__name__)
-        
-        try:
-            logger.info(f"📥 Attempting to download from bucket '{bucket}' path '{path}'")
-            response = self.client.storage.from_(bucket).download(path)
-            
-            # Handle different response types
-            if isinstance(response, bytes):
-                logger.info(f"✅ Downloaded {len(response)} bytes")
-                return response
-            elif hasattr(response, 'data'):
-                logger.info(f"✅ Downloaded {len(response.data)} bytes")
-                return response.data
+    def get_signed_download_urls(
+        self,
+        bucket: str,
+        paths: List[str],
+        expires_in: int = 3600
+    ) -> Dict[str, str]:
+        """
+        Generate signed download URLs for many files in one request, keyed by path
+
+        Paths whose object is missing (e.g. an upload that was never finished)
+        come back with an error and no URL; they are left out of the result.
+        Storage is called directly because storage3's create_signed_urls
+        fails on the whole batch when any item has no signedURL.
+        """
+        if not paths:
+            return {}
+        response = self._storage_http.post(
+            f"{self._storage_url}/object/sign/{bucket}",
+            json={"expiresIn": expires_in, "paths": paths}
+        )
+        response.raise_for_status()
+        urls = {}
+        for item in response.json():
+            signed_url = item.get("signedURL")
+            if item.get("error") or not signed_url or not item.get("path"):
+                continue
+            urls[item["path"]] = f"{self._storage_url}/{signed_url.lstrip('/')}"
+        return urls
+    
+    def iter_download_file(
+        self,
+        bucket: str,
+        path: str,
+        chunk_size: int = DOWNLOAD_CHUNK_SIZE
+    ) -> Iterator[bytes]:
+        """Stream a file from storage in chunks instead of buffering it whole"""
+        url = f"{self._storage_url}/object/{bucket}/{quote(path, safe='/')}"
+        with self._storage_http.stream("GET", url) as response:
+            response.raise_for_status()
+            yield from response.iter_bytes(chunk_size)
+    
+    def delete_storage_objects(self, files: List[Dict[str, Any]]) -> None:
+        """
+        Delete the storage objects of file rows ({file_path, bucket}), with one
+        request per bucket, in parallel (best-effort)
+
+        Rows without a bucket (created before migrations/010_files_bucket.sql)
+        are removed from every known bucket.
+        """
+        paths_by_bucket: Dict[str, List[str]] = defaultdict(list)
+        unknown_bucket = []
+        for f in files:
+            if not f.get("file_path"):
+                continue
+            if f.get("bucket"):
+                paths_by_bucket[f["bucket"]].append(f["file_path"])
             else:
-                logger.error(f"❌ Unexpected response type: {type(response)}")
-                raise Exception(f"Unexpected response type from storage download: {type(response)}")
-                
-        except Exception as e:
-            logger.error(f"❌ Storage download failed: {str(e)}")
-            logger.error(f"   Bucket: {bucket}")
-            logger.error(f"   Path: {path}")
-            raise
+                unknown_bucket.append(f["file_path"])
+        if unknown_bucket:
+            for bucket in BUCKETS:
+                paths_by_bucket[bucket].extend(unknown_bucket)
+        if not paths_by_bucket:
+            return
+        # Buckets are independent, so overlap their remove requests
+        with ThreadPoolExecutor(max_workers=len(paths_by_bucket)) as executor:
+            list(executor.map(lambda item: self._remove_from_bucket(*item), paths_by_bucket.items()))
 
-    def delete_storage_file(self, path: str) -> None:
-        """Delete a file from known buckets if present (best-effort)."""
-        import logging
-        logger = logging.getLogger(__name__)
-        settings = get_settings()
-        buckets = [settings.bucket_legal, settings.bucket_images]
-        for bucket in buckets:
+    def _remove_from_bucket(self, bucket: str, paths: List[str]) -> None:
+        """Remove paths from one bucket, STORAGE_REMOVE_BATCH paths per request (best-effort)."""
+        for start in range(0, len(paths), STORAGE_REMOVE_BATCH):
+            batch = paths[start:start + STORAGE_REMOVE_BATCH]
             try:
-                # Supabase remove expects a list of paths
-                self.client.storage.from_(bucket).remove([path])
-                logger.info(f"🗑️ Deleted storage file '{path}' from bucket '{bucket}'")
+                # Supabase remove accepts a list of paths
+                self.client.storage.from_(bucket).remove(batch)
+                logger.info("🗑️ Deleted %s storage files from bucket '%s'", len(batch), bucket)
             except Exception as e:
                 # Ignore not-found; log other errors
-                logger.warning(f"⚠️ Could not delete '{path}' from '{bucket}': {str(e)}")
+                logger.warning("⚠️ Could not delete %s files from '%s': %s", len(batch), bucket, e)
     
     # Admin operations
+    def list_auth_users(self, per_page: int = 1000) -> Dict[str, Any]:
+        """Get all auth users, paging through the admin API, keyed by user ID"""
+        users = {}
+        page = 1
+        while True:
+            batch = self.client.auth.admin.list_users(page=page, per_page=per_page)
+            for user in batch:
+                users[user.id] = user
+            if len(batch) < per_page:
+                return users
+            page += 1
+    
+    def get_distinct_chat_user_ids(self) -> List[str]:
+        """Get IDs of all users with at least one chat"""
+        try:
+            return self.client.rpc("distinct_chat_user_ids").execute().data or []
+        except APIError as e:
+            if e.code != "PGRST202":
+                raise
+            # Function not deployed yet (migrations/003_distinct_chat_user_ids.sql)
+            response = self.client.table("chats").select("user_id").execute()
+            return list({chat["user_id"] for chat in response.data or []})
+    
+    def get_admin_user_stats(self) -> List[Dict[str, Any]]:
+        """
+        Get chat/file counts and first chat time for every user with chats
+
+        Returns dicts with user_id, chat_count, file_count and first_chat_at.
+        """
+        try:
+            return self.client.rpc("admin_user_stats").execute().data or []
+        except APIError as e:
+            if e.code != "PGRST202":
+                raise
+        
+        # Function not deployed yet (migrations/005_admin_user_stats.sql):
+        # aggregate from two bulk queries instead
+        chats = self.client.table("chats").select("user_id, created_at").execute().data or []
+        files = self.client.table("files").select("user_id").execute().data or []
+        chat_counts = Counter(chat["user_id"] for chat in chats)
+        file_counts = Counter(file["user_id"] for file in files)
+        first_chat_at = {}
+        for chat in chats:
+            created_at = first_chat_at.get(chat["user_id"])
+            if created_at is None or chat["created_at"] < created_at:
+                first_chat_at[chat["user_id"]] = chat["created_at"]
+        return [
+            {
+                "user_id": user_id,
+                "chat_count": chat_count,
+                "file_count": file_counts[user_id],
+                "first_chat_at": first_chat_at[user_id]
+            }
+            for user_id, chat_count in chat_counts.items()
+        ]
+    
     def get_admin_stats(self) -> Dict[str, Any]:
         """Get admin overview statistics"""
-        # Count unique users from chats
-        chats_response = self.client.table("chats").select("user_id", count="exact").execute()
+        try:
+            return self.client.rpc("admin_stats").execute().data[0]
+        except APIError as e:
+            if e.code != "PGRST202":
+                raise
+        
+        # Function not deployed yet (migrations/009_admin_stats.sql)
+        # Count chats, and unique users from chats (deduplicated in SQL)
+        chats_response = self.client.table("chats").select("*", count="exact", head=True).execute()
+        total_users = len(self.get_distinct_chat_user_ids())
         
-        # Count total messages
-        messages_response = self.client.table("messages").select("*", count="exact").execute()
+        # Count total messages (HEAD request: count only, no rows transferred)
+        messages_response = self.client.table("messages").select("*", count="exact", head=True).execute()
         
         # Count total files
-        files_response = self.client.table("files").select("*", count="exact").execute()
+        files_response = self.client.table("files").select("*", count="exact", head=True).execute()
         
         # Get recent activity (last 10 chats)
         recent_chats = (
@@ -350,7 +755,7 @@ class SupabaseClient:
         )
         
         return {
-            "total_users": len(set(chat["user_id"] for chat in chats_response.data)) if chats_response.data else 0,
+            "total_users": total_users,
             "total_chats": chats_response.count or 0,
             "total_messages": messages_response.count or 0,
             "total_files": files_response.count or 0,
@@ -1,25 +1,41 @@
 """
 Utility functions for the application
 """
+import hmac
 import os
-from datetime import datetime
+import re
+import secrets
+import time
 from functools import lru_cache
-from typing import Optional
+from typing import Optional, Tuple
 
 from pydantic_settings import BaseSettings
 
 
+# Runs of characters not allowed in stored filenames
+_UNSAFE_FILENAME_CHARS = re.compile(r'[^\w\s\-.]+')
+
+
 class Settings(BaseSettings):
     """Application settings loaded from environment variables"""
     
     # OpenAI
     openai_api_key: str
     model_id: str = "gpt-5"
+    openai_max_concurrency: int = 32  # Max simultaneous upstream completions
     
     # Supabase
     supabase_url: str
     supabase_service_role_key: str
     
+    # Direct Postgres connection (optional, used for admin aggregates)
+    database_url: Optional[str] = None
+    # Supavisor transaction-mode pooler (port 6543); used instead of database_url when set
+    database_pooler_url: Optional[str] = None
+    
+    # Redis (optional, response cache; in-process cache when unset)
+    redis_url: Optional[str] = None
+    
     # Storage Buckets
     bucket_legal: str = "legal-docs"
     bucket_images: str = "images"
@@ -36,42 +52,55 @@ class Settings(BaseSettings):
         env_file_encoding = "utf-8"
         case_sensitive = False
         protected_namespaces = ('settings_',)
+        frozen = True  # Shared via get_settings(); must not be mutated
 
 
-@lru_cache()
+@lru_cache(maxsize=1)
 def get_settings() -> Settings:
     """Get cached settings instance"""
     return Settings()
 
 
-def get_allowed_origins() -> list:
-    """Parse allowed origins from settings"""
+@lru_cache(maxsize=1)
+def get_allowed_origins() -> Tuple[str, ...]:
+    """Parse allowed origins from settings (cached; a tuple so it can't be mutated)"""
     settings = get_settings()
-    return [origin.strip() for origin in settings.allowed_origins.split(",")]
+    return tuple(origin.strip() for origin in settings.allowed_origins.split(","))
+
+
+@lru_cache(maxsize=1)
+def _admin_token_bytes() -> Optional[bytes]:
+    """Admin token from settings, encoded once"""
+    token = get_settings().admin_token
+    return token.encode() if token else None
 
 
 def verify_admin_key(api_key: Optional[str]) -> bool:
-    """Verify admin token"""
-    settings = get_settings()
-    if not settings.admin_token:
+    """Verify admin token (constant-time comparison)"""
+    token = _admin_token_bytes()
+    if not token or not api_key:
         return False
-    return api_key == settings.admin_token
+    return hmac.compare_digest(token, api_key.encode())
 
 
 def sanitize_filename(filename: str) -> str:
     """Sanitize filename for safe storage"""
-    import re
-    # Remove any path components
-    filename = os.path.basename(filename)
-    # Replace unsafe characters
-    filename = re.sub(r'[^\w\s\-\.]', '_', filename)
-    return filename
+    # Remove any path components, then replace each run of unsafe characters
+    return _UNSAFE_FILENAME_CHARS.sub('_', os.path.basename(filename))
 
 
 def generate_file_path(user_id: str, filename: str) -> str:
     """Generate a unique file path for storage"""
-    import uuid
-    timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
-    unique_id = str(uuid.uuid4())[:8]
+    timestamp = time.strftime("%Y%m%d_%H%M%S", time.gmtime())
+    unique_id = secrets.token_hex(4)
     safe_filename = sanitize_filename(filename)
     return f"{user_id}/{timestamp}_{unique_id}_{safe_filename}"
+
+
+# Settings never change after startup, so hot paths read these module
+# constants instead of calling get_settings() per request
+SETTINGS = get_settings()
+SUPABASE_URL = SETTINGS.supabase_url.rstrip("/")
+# Stripped: secrets from GCP Secret Manager can carry a trailing newline
+SUPABASE_SERVICE_KEY = (SETTINGS.supabase_service_role_key or "").strip()
+BUCKETS = (SETTINGS.bucket_legal, SETTINGS.bucket_images)
@@ -0,0 +1,30 @@
+-- Migration: Add delete_chat_cascade function for single-call chat deletion
+-- Run this in your Supabase SQL Editor
+
+-- Verifies ownership and deletes a chat with its messages, file chunks and
+-- file records in one transaction. Returns the deleted files so the caller
+-- can remove their storage objects.
+--   P0002 = chat not found, 42501 = chat belongs to another user
+CREATE OR REPLACE FUNCTION delete_chat_cascade(p_chat_id UUID, p_user_id UUID)
+RETURNS TABLE(file_id UUID, file_path TEXT) AS $$
+#variable_conflict use_column
+DECLARE
+    v_owner UUID;
+BEGIN
+    SELECT c.user_id INTO v_owner FROM chats c WHERE c.id = p_chat_id FOR UPDATE;
+    IF NOT FOUND THEN
+        RAISE EXCEPTION 'Chat not found' USING ERRCODE = 'P0002';
+    END IF;
+    IF v_owner <> p_user_id THEN
+        RAISE EXCEPTION 'Not authorized to delete this chat' USING ERRCODE = '42501';
+    END IF;
+
+    DELETE FROM messages m WHERE m.chat_id = p_chat_id;
+    DELETE FROM file_chunks fc USING files f WHERE fc.file_id = f.id AND f.chat_id = p_chat_id;
+    RETURN QUERY DELETE FROM files f WHERE f.chat_id = p_chat_id RETURNING f.id, f.file_path;
+    DELETE FROM chats c WHERE c.id = p_chat_id;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Only the backend (service role) may call this
+REVOKE EXECUTE ON FUNCTION delete_chat_cascade(UUID, UUID) FROM PUBLIC, anon, authenticated;
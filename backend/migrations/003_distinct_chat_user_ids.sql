@@ -0,0 +1,12 @@
+-- Migration: Add distinct_chat_user_ids function for admin stats
+-- Run this in your Supabase SQL Editor
+
+-- Distinct users that have at least one chat, deduplicated in SQL so only
+-- unique IDs are sent over the wire (uses idx_chats_user_id)
+CREATE OR REPLACE FUNCTION distinct_chat_user_ids()
+RETURNS SETOF UUID AS $$
+    SELECT DISTINCT user_id FROM chats;
+$$ LANGUAGE sql STABLE;
+
+-- Only the backend (service role) may call this
+REVOKE EXECUTE ON FUNCTION distinct_chat_user_ids() FROM PUBLIC, anon, authenticated;
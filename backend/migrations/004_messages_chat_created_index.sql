@@ -0,0 +1,7 @@
+-- Migration: Composite index for reading a chat's latest messages
+-- Run this in your Supabase SQL Editor
+
+-- Serves "WHERE chat_id = ? ORDER BY created_at DESC LIMIT n" without a sort;
+-- supersedes the single-column chat_id index
+CREATE INDEX IF NOT EXISTS idx_messages_chat_id_created_at ON messages(chat_id, created_at);
+DROP INDEX IF EXISTS idx_messages_chat_id;
@@ -0,0 +1,24 @@
+-- Migration: Add admin_user_stats function for the admin users list
+-- Run this in your Supabase SQL Editor
+
+-- Per-user chat and file counts in one grouped query. Chats and files are
+-- counted separately so a join between them can't multiply the counts.
+CREATE OR REPLACE FUNCTION admin_user_stats()
+RETURNS TABLE(user_id UUID, chat_count BIGINT, file_count BIGINT, first_chat_at TIMESTAMP WITH TIME ZONE) AS $$
+    WITH chat_counts AS (
+        SELECT c.user_id, COUNT(*) AS chat_count, MIN(c.created_at) AS first_chat_at
+        FROM chats c
+        GROUP BY c.user_id
+    ),
+    file_counts AS (
+        SELECT f.user_id, COUNT(*) AS file_count
+        FROM files f
+        GROUP BY f.user_id
+    )
+    SELECT cc.user_id, cc.chat_count, COALESCE(fc.file_count, 0), cc.first_chat_at
+    FROM chat_counts cc
+    LEFT JOIN file_counts fc ON fc.user_id = cc.user_id;
+$$ LANGUAGE sql STABLE;
+
+-- Only the backend (service role) may call this
+REVOKE EXECUTE ON FUNCTION admin_user_stats() FROM PUBLIC, anon, authenticated;
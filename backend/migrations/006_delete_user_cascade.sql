@@ -0,0 +1,20 @@
+-- Migration: Add delete_user_cascade function for admin user deletion
+-- Run this in your Supabase SQL Editor
+
+-- Deletes all of a user's app data (file chunks, files, messages, chats,
+-- profile) in one transaction. Returns the deleted files so the caller can
+-- remove their storage objects; the auth account is deleted separately.
+CREATE OR REPLACE FUNCTION delete_user_cascade(p_user_id UUID)
+RETURNS TABLE(file_id UUID, file_path TEXT) AS $$
+#variable_conflict use_column
+BEGIN
+    DELETE FROM file_chunks fc USING files f WHERE fc.file_id = f.id AND f.user_id = p_user_id;
+    RETURN QUERY DELETE FROM files f WHERE f.user_id = p_user_id RETURNING f.id, f.file_path;
+    DELETE FROM messages m USING chats c WHERE m.chat_id = c.id AND c.user_id = p_user_id;
+    DELETE FROM chats c WHERE c.user_id = p_user_id;
+    DELETE FROM profiles p WHERE p.user_id = p_user_id;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Only the backend (service role) may call this
+REVOKE EXECUTE ON FUNCTION delete_user_cascade(UUID) FROM PUBLIC, anon, authenticated;
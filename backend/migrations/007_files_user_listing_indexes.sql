@@ -0,0 +1,13 @@
+-- Migration: Indexes for newest-first file listings per user (and per chat)
+-- Run this in your Supabase SQL Editor
+-- On large tables, run each CREATE INDEX separately with CONCURRENTLY instead
+
+-- Covers get_user_files(user_id, chat_id) ordered by created_at, including the
+-- listing columns so narrow selects can be answered from the index alone
+CREATE INDEX IF NOT EXISTS idx_files_user_chat_created_at
+    ON files(user_id, chat_id, created_at DESC)
+    INCLUDE (filename, file_path, mime_type, status);
+
+-- Serves the unfiltered per-user listing in order; supersedes idx_files_user_id
+CREATE INDEX IF NOT EXISTS idx_files_user_created_at ON files(user_id, created_at DESC);
+DROP INDEX IF EXISTS idx_files_user_id;
@@ -0,0 +1,27 @@
+-- Migration: Add delete_file_owned function for single-call file deletion
+-- Run this in your Supabase SQL Editor
+
+-- Verifies ownership and deletes a file record and its chunks in one
+-- transaction. Returns the storage path so the caller can remove the object.
+--   P0002 = file not found, 42501 = file belongs to another user
+CREATE OR REPLACE FUNCTION delete_file_owned(p_file_id UUID, p_user_id UUID)
+RETURNS TABLE(file_path TEXT) AS $$
+#variable_conflict use_column
+DECLARE
+    v_owner UUID;
+BEGIN
+    SELECT f.user_id INTO v_owner FROM files f WHERE f.id = p_file_id FOR UPDATE;
+    IF NOT FOUND THEN
+        RAISE EXCEPTION 'File not found' USING ERRCODE = 'P0002';
+    END IF;
+    IF v_owner <> p_user_id THEN
+        RAISE EXCEPTION 'Unauthorized' USING ERRCODE = '42501';
+    END IF;
+
+    DELETE FROM file_chunks fc WHERE fc.file_id = p_file_id;
+    RETURN QUERY DELETE FROM files f WHERE f.id = p_file_id RETURNING f.file_path;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Only the backend (service role) may call this
+REVOKE EXECUTE ON FUNCTION delete_file_owned(UUID, UUID) FROM PUBLIC, anon, authenticated;
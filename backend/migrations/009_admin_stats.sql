@@ -0,0 +1,30 @@
+-- Migration: Add admin_stats function for the admin overview
+-- Run this in your Supabase SQL Editor
+
+-- All overview totals plus the 10 most recent chats in one round-trip
+CREATE OR REPLACE FUNCTION admin_stats()
+RETURNS TABLE(
+    total_users BIGINT,
+    total_chats BIGINT,
+    total_messages BIGINT,
+    total_files BIGINT,
+    recent_activity JSONB
+) AS $$
+    SELECT
+        (SELECT COUNT(DISTINCT user_id) FROM chats),
+        (SELECT COUNT(*) FROM chats),
+        (SELECT COUNT(*) FROM messages),
+        (SELECT COUNT(*) FROM files),
+        (
+            SELECT COALESCE(jsonb_agg(to_jsonb(c)), '[]'::jsonb)
+            FROM (
+                SELECT id, user_id, title, created_at
+                FROM chats
+                ORDER BY created_at DESC
+                LIMIT 10
+            ) c
+        );
+$$ LANGUAGE sql STABLE;
+
+-- Only the backend (service role) may call this
+REVOKE EXECUTE ON FUNCTION admin_stats() FROM PUBLIC, anon, authenticated;
@@ -0,0 +1,86 @@
+-- Migration: Record each file's storage bucket
+-- Run this in your Supabase SQL Editor
+
+-- Existing rows are left NULL: readers fall back to the configured legal
+-- bucket (BUCKET_LEGAL), and new rows always record their bucket
+ALTER TABLE files ADD COLUMN IF NOT EXISTS bucket TEXT;
+ALTER TABLE files ALTER COLUMN bucket DROP NOT NULL, ALTER COLUMN bucket DROP DEFAULT;
+
+-- The delete functions also return the bucket, so storage objects are
+-- removed from the right bucket only (return types change, so drop first)
+DROP FUNCTION IF EXISTS delete_chat_cascade(UUID, UUID);
+
+-- Verifies ownership and deletes a chat with its messages, file chunks and
+-- file records in one transaction. Returns the deleted files so the caller
+-- can remove their storage objects.
+--   P0002 = chat not found, 42501 = chat belongs to another user
+CREATE OR REPLACE FUNCTION delete_chat_cascade(p_chat_id UUID, p_user_id UUID)
+RETURNS TABLE(file_id UUID, file_path TEXT, bucket TEXT) AS $$
+#variable_conflict use_column
+DECLARE
+    v_owner UUID;
+BEGIN
+    SELECT c.user_id INTO v_owner FROM chats c WHERE c.id = p_chat_id FOR UPDATE;
+    IF NOT FOUND THEN
+        RAISE EXCEPTION 'Chat not found' USING ERRCODE = 'P0002';
+    END IF;
+    IF v_owner <> p_user_id THEN
+        RAISE EXCEPTION 'Not authorized to delete this chat' USING ERRCODE = '42501';
+    END IF;
+
+    DELETE FROM messages m WHERE m.chat_id = p_chat_id;
+    DELETE FROM file_chunks fc USING files f WHERE fc.file_id = f.id AND f.chat_id = p_chat_id;
+    RETURN QUERY DELETE FROM files f WHERE f.chat_id = p_chat_id RETURNING f.id, f.file_path, f.bucket;
+    DELETE FROM chats c WHERE c.id = p_chat_id;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Only the backend (service role) may call this
+REVOKE EXECUTE ON FUNCTION delete_chat_cascade(UUID, UUID) FROM PUBLIC, anon, authenticated;
+
+DROP FUNCTION IF EXISTS delete_file_owned(UUID, UUID);
+
+-- Verifies ownership and deletes a file record and its chunks in one
+-- transaction. Returns the storage path so the caller can remove the object.
+--   P0002 = file not found, 42501 = file belongs to another user
+CREATE OR REPLACE FUNCTION delete_file_owned(p_file_id UUID, p_user_id UUID)
+RETURNS TABLE(file_path TEXT, bucket TEXT) AS $$
+#variable_conflict use_column
+DECLARE
+    v_owner UUID;
+BEGIN
+    SELECT f.user_id INTO v_owner FROM files f WHERE f.id = p_file_id FOR UPDATE;
+    IF NOT FOUND THEN
+        RAISE EXCEPTION 'File not found' USING ERRCODE = 'P0002';
+    END IF;
+    IF v_owner <> p_user_id THEN
+        RAISE EXCEPTION 'Unauthorized' USING ERRCODE = '42501';
+    END IF;
+
+    DELETE FROM file_chunks fc WHERE fc.file_id = p_file_id;
+    RETURN QUERY DELETE FROM files f WHERE f.id = p_file_id RETURNING f.file_path, f.bucket;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Only the backend (service role) may call this
+REVOKE EXECUTE ON FUNCTION delete_file_owned(UUID, UUID) FROM PUBLIC, anon, authenticated;
+
+DROP FUNCTION IF EXISTS delete_user_cascade(UUID);
+
+-- Deletes all of a user's app data (file chunks, files, messages, chats,
+-- profile) in one transaction. Returns the deleted files so the caller can
+-- remove their storage objects; the auth account is deleted separately.
+CREATE OR REPLACE FUNCTION delete_user_cascade(p_user_id UUID)
+RETURNS TABLE(file_id UUID, file_path TEXT, bucket TEXT) AS $$
+#variable_conflict use_column
+BEGIN
+    DELETE FROM file_chunks fc USING files f WHERE fc.file_id = f.id AND f.user_id = p_user_id;
+    RETURN QUERY DELETE FROM files f WHERE f.user_id = p_user_id RETURNING f.id, f.file_path, f.bucket;
+    DELETE FROM messages m USING chats c WHERE m.chat_id = c.id AND c.user_id = p_user_id;
+    DELETE FROM chats c WHERE c.user_id = p_user_id;
+    DELETE FROM profiles p WHERE p.user_id = p_user_id;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Only the backend (service role) may call this
+REVOKE EXECUTE ON FUNCTION delete_user_cascade(UUID) FROM PUBLIC, anon, authenticated;
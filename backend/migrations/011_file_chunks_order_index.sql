@@ -0,0 +1,7 @@
+-- Migration: Composite index for reading a file's chunks in order
+-- Run this in your Supabase SQL Editor
+
+-- Serves "WHERE file_id IN (...) ORDER BY chunk_index" without a sort;
+-- supersedes the single-column file_id index
+CREATE INDEX IF NOT EXISTS idx_file_chunks_file_id_chunk_index ON file_chunks(file_id, chunk_index);
+DROP INDEX IF EXISTS idx_file_chunks_file_id;
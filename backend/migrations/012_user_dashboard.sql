@@ -0,0 +1,31 @@
+-- Migration: Add user_dashboard function for loading a user's chats and files together
+-- Run this in your Supabase SQL Editor
+
+-- A user's latest chats and files in one round-trip, ordered like the
+-- separate listings (chats by updated_at, files by created_at, newest first)
+CREATE OR REPLACE FUNCTION user_dashboard(p_user_id UUID, p_limit INT DEFAULT 50)
+RETURNS JSONB AS $$
+    SELECT jsonb_build_object(
+        'chats', (
+            SELECT COALESCE(jsonb_agg(to_jsonb(c) ORDER BY c.updated_at DESC), '[]'::jsonb)
+            FROM (
+                SELECT * FROM chats
+                WHERE user_id = p_user_id
+                ORDER BY updated_at DESC
+                LIMIT p_limit
+            ) c
+        ),
+        'files', (
+            SELECT COALESCE(jsonb_agg(to_jsonb(f) ORDER BY f.created_at DESC), '[]'::jsonb)
+            FROM (
+                SELECT * FROM files
+                WHERE user_id = p_user_id
+                ORDER BY created_at DESC
+                LIMIT p_limit
+            ) f
+        )
+    );
+$$ LANGUAGE sql STABLE;
+
+-- Only the backend (service role) may call this
+REVOKE EXECUTE ON FUNCTION user_dashboard(UUID, INT) FROM PUBLIC, anon, authenticated;
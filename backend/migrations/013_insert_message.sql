@@ -0,0 +1,25 @@
+-- Migration: Add insert_message function for the chat hot path
+-- Run this in your Supabase SQL Editor
+
+-- Inserts one message and returns the row. As a PL/pgSQL function its INSERT
+-- plan is prepared once per database connection and reused.
+CREATE OR REPLACE FUNCTION insert_message(
+    p_chat_id UUID,
+    p_role TEXT,
+    p_content TEXT,
+    p_metadata JSONB DEFAULT '{}'::jsonb,
+    p_id UUID DEFAULT NULL
+)
+RETURNS messages AS $$
+DECLARE
+    v_message messages;
+BEGIN
+    INSERT INTO messages (id, chat_id, role, content, metadata)
+    VALUES (COALESCE(p_id, uuid_generate_v4()), p_chat_id, p_role, p_content, COALESCE(p_metadata, '{}'::jsonb))
+    RETURNING * INTO v_message;
+    RETURN v_message;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Only the backend (service role) may call this
+REVOKE EXECUTE ON FUNCTION insert_message(UUID, TEXT, TEXT, JSONB, UUID) FROM PUBLIC, anon, authenticated;
@@ -41,6 +41,7 @@ CREATE TABLE IF NOT EXISTS files (
     user_id UUID NOT NULL,
     filename TEXT NOT NULL,
     file_path TEXT NOT NULL,
+    bucket TEXT,
     file_size INTEGER,
     mime_type TEXT,
     status TEXT DEFAULT 'pending' CHECK (status IN ('pending', 'processing', 'completed', 'failed')),
@@ -62,11 +63,12 @@ CREATE TABLE IF NOT EXISTS file_chunks (
 -- Indexes for performance
 CREATE INDEX IF NOT EXISTS idx_chats_user_id ON chats(user_id);
 CREATE INDEX IF NOT EXISTS idx_chats_created_at ON chats(created_at DESC);
-CREATE INDEX IF NOT EXISTS idx_messages_chat_id ON messages(chat_id);
+CREATE INDEX IF NOT EXISTS idx_messages_chat_id_created_at ON messages(chat_id, created_at);
 CREATE INDEX IF NOT EXISTS idx_messages_created_at ON messages(created_at);
 CREATE INDEX IF NOT EXISTS idx_files_chat_id ON files(chat_id);
-CREATE INDEX IF NOT EXISTS idx_files_user_id ON files(user_id);
-CREATE INDEX IF NOT EXISTS idx_file_chunks_file_id ON file_chunks(file_id);
+CREATE INDEX IF NOT EXISTS idx_files_user_created_at ON files(user_id, created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_files_user_chat_created_at ON files(user_id, chat_id, created_at DESC) INCLUDE (filename, file_path, mime_type, status);
+CREATE INDEX IF NOT EXISTS idx_file_chunks_file_id_chunk_index ON file_chunks(file_id, chunk_index);
 
 -- RLS Policies (Row Level Security)
 ALTER TABLE profiles ENABLE ROW LEVEL SECURITY;
@@ -169,3 +171,186 @@ CREATE TRIGGER update_chats_updated_at
     BEFORE UPDATE ON chats
     FOR EACH ROW
     EXECUTE FUNCTION update_updated_at_column();
+
+-- Verifies ownership and deletes a chat with its messages, file chunks and
+-- file records in one transaction. Returns the deleted files so the caller
+-- can remove their storage objects.
+--   P0002 = chat not found, 42501 = chat belongs to another user
+CREATE OR REPLACE FUNCTION delete_chat_cascade(p_chat_id UUID, p_user_id UUID)
+RETURNS TABLE(file_id UUID, file_path TEXT, bucket TEXT) AS $$
+#variable_conflict use_column
+DECLARE
+    v_owner UUID;
+BEGIN
+    SELECT c.user_id INTO v_owner FROM chats c WHERE c.id = p_chat_id FOR UPDATE;
+    IF NOT FOUND THEN
+        RAISE EXCEPTION 'Chat not found' USING ERRCODE = 'P0002';
+    END IF;
+    IF v_owner <> p_user_id THEN
+        RAISE EXCEPTION 'Not authorized to delete this chat' USING ERRCODE = '42501';
+    END IF;
+
+    DELETE FROM messages m WHERE m.chat_id = p_chat_id;
+    DELETE FROM file_chunks fc USING files f WHERE fc.file_id = f.id AND f.chat_id = p_chat_id;
+    RETURN QUERY DELETE FROM files f WHERE f.chat_id = p_chat_id RETURNING f.id, f.file_path, f.bucket;
+    DELETE FROM chats c WHERE c.id = p_chat_id;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Only the backend (service role) may call this
+REVOKE EXECUTE ON FUNCTION delete_chat_cascade(UUID, UUID) FROM PUBLIC, anon, authenticated;
+
+-- Distinct users that have at least one chat, deduplicated in SQL so only
+-- unique IDs are sent over the wire (uses idx_chats_user_id)
+CREATE OR REPLACE FUNCTION distinct_chat_user_ids()
+RETURNS SETOF UUID AS $$
+    SELECT DISTINCT user_id FROM chats;
+$$ LANGUAGE sql STABLE;
+
+-- Only the backend (service role) may call this
+REVOKE EXECUTE ON FUNCTION distinct_chat_user_ids() FROM PUBLIC, anon, authenticated;
+
+-- Per-user chat and file counts in one grouped query. Chats and files are
+-- counted separately so a join between them can't multiply the counts.
+CREATE OR REPLACE FUNCTION admin_user_stats()
+RETURNS TABLE(user_id UUID, chat_count BIGINT, file_count BIGINT, first_chat_at TIMESTAMP WITH TIME ZONE) AS $$
+    WITH chat_counts AS (
+        SELECT c.user_id, COUNT(*) AS chat_count, MIN(c.created_at) AS first_chat_at
+        FROM chats c
+        GROUP BY c.user_id
+    ),
+    file_counts AS (
+        SELECT f.user_id, COUNT(*) AS file_count
+        FROM files f
+        GROUP BY f.user_id
+    )
+    SELECT cc.user_id, cc.chat_count, COALESCE(fc.file_count, 0), cc.first_chat_at
+    FROM chat_counts cc
+    LEFT JOIN file_counts fc ON fc.user_id = cc.user_id;
+$$ LANGUAGE sql STABLE;
+
+-- Only the backend (service role) may call this
+REVOKE EXECUTE ON FUNCTION admin_user_stats() FROM PUBLIC, anon, authenticated;
+
+-- Deletes all of a user's app data (file chunks, files, messages, chats,
+-- profile) in one transaction. Returns the deleted files so the caller can
+-- remove their storage objects; the auth account is deleted separately.
+CREATE OR REPLACE FUNCTION delete_user_cascade(p_user_id UUID)
+RETURNS TABLE(file_id UUID, file_path TEXT, bucket TEXT) AS $$
+#variable_conflict use_column
+BEGIN
+    DELETE FROM file_chunks fc USING files f WHERE fc.file_id = f.id AND f.user_id = p_user_id;
+    RETURN QUERY DELETE FROM files f WHERE f.user_id = p_user_id RETURNING f.id, f.file_path, f.bucket;
+    DELETE FROM messages m USING chats c WHERE m.chat_id = c.id AND c.user_id = p_user_id;
+    DELETE FROM chats c WHERE c.user_id = p_user_id;
+    DELETE FROM profiles p WHERE p.user_id = p_user_id;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Only the backend (service role) may call this
+REVOKE EXECUTE ON FUNCTION delete_user_cascade(UUID) FROM PUBLIC, anon, authenticated;
+
+-- Verifies ownership and deletes a file record and its chunks in one
+-- transaction. Returns the storage path so the caller can remove the object.
+--   P0002 = file not found, 42501 = file belongs to another user
+CREATE OR REPLACE FUNCTION delete_file_owned(p_file_id UUID, p_user_id UUID)
+RETURNS TABLE(file_path TEXT, bucket TEXT) AS $$
+#variable_conflict use_column
+DECLARE
+    v_owner UUID;
+BEGIN
+    SELECT f.user_id INTO v_owner FROM files f WHERE f.id = p_file_id FOR UPDATE;
+    IF NOT FOUND THEN
+        RAISE EXCEPTION 'File not found' USING ERRCODE = 'P0002';
+    END IF;
+    IF v_owner <> p_user_id THEN
+        RAISE EXCEPTION 'Unauthorized' USING ERRCODE = '42501';
+    END IF;
+
+    DELETE FROM file_chunks fc WHERE fc.file_id = p_file_id;
+    RETURN QUERY DELETE FROM files f WHERE f.id = p_file_id RETURNING f.file_path, f.bucket;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Only the backend (service role) may call this
+REVOKE EXECUTE ON FUNCTION delete_file_owned(UUID, UUID) FROM PUBLIC, anon, authenticated;
+
+-- All overview totals plus the 10 most recent chats in one round-trip
+CREATE OR REPLACE FUNCTION admin_stats()
+RETURNS TABLE(
+    total_users BIGINT,
+    total_chats BIGINT,
+    total_messages BIGINT,
+    total_files BIGINT,
+    recent_activity JSONB
+) AS $$
+    SELECT
+        (SELECT COUNT(DISTINCT user_id) FROM chats),
+        (SELECT COUNT(*) FROM chats),
+        (SELECT COUNT(*) FROM messages),
+        (SELECT COUNT(*) FROM files),
+        (
+            SELECT COALESCE(jsonb_agg(to_jsonb(c)), '[]'::jsonb)
+            FROM (
+                SELECT id, user_id, title, created_at
+                FROM chats
+                ORDER BY created_at DESC
+                LIMIT 10
+            ) c
+        );
+$$ LANGUAGE sql STABLE;
+
+-- Only the backend (service role) may call this
+REVOKE EXECUTE ON FUNCTION admin_stats() FROM PUBLIC, anon, authenticated;
+
+-- A user's latest chats and files in one round-trip, ordered like the
+-- separate listings (chats by updated_at, files by created_at, newest first)
+CREATE OR REPLACE FUNCTION user_dashboard(p_user_id UUID, p_limit INT DEFAULT 50)
+RETURNS JSONB AS $$
+    SELECT jsonb_build_object(
+        'chats', (
+            SELECT COALESCE(jsonb_agg(to_jsonb(c) ORDER BY c.updated_at DESC), '[]'::jsonb)
+            FROM (
+                SELECT * FROM chats
+                WHERE user_id = p_user_id
+                ORDER BY updated_at DESC
+                LIMIT p_limit
+            ) c
+        ),
+        'files', (
+            SELECT COALESCE(jsonb_agg(to_jsonb(f) ORDER BY f.created_at DESC), '[]'::jsonb)
+            FROM (
+                SELECT * FROM files
+                WHERE user_id = p_user_id
+                ORDER BY created_at DESC
+                LIMIT p_limit
+            ) f
+        )
+    );
+$$ LANGUAGE sql STABLE;
+
+-- Only the backend (service role) may call this
+REVOKE EXECUTE ON FUNCTION user_dashboard(UUID, INT) FROM PUBLIC, anon, authenticated;
+
+-- Inserts one message and returns the row. As a PL/pgSQL function its INSERT
+-- plan is prepared once per database connection and reused.
+CREATE OR REPLACE FUNCTION insert_message(
+    p_chat_id UUID,
+    p_role TEXT,
+    p_content TEXT,
+    p_metadata JSONB DEFAULT '{}'::jsonb,
+    p_id UUID DEFAULT NULL
+)
+RETURNS messages AS $$
+DECLARE
+    v_message messages;
+BEGIN
+    INSERT INTO messages (id, chat_id, role, content, metadata)
+    VALUES (COALESCE(p_id, uuid_generate_v4()), p_chat_id, p_role, p_content, COALESCE(p_metadata, '{}'::jsonb))
+    RETURNING * INTO v_message;
+    RETURN v_message;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Only the backend (service role) may call this
+REVOKE EXECUTE ON FUNCTION insert_message(UUID, TEXT, TEXT, JSONB, UUID) FROM PUBLIC, anon, authenticated;
@@ -0,0 +1,26 @@
+"""
+Shared test fixtures
+
+Settings are read from the environment when app.utils is imported, so
+placeholder values are set before any app module is loaded.
+"""
+import os
+
+os.environ.setdefault("OPENAI_API_KEY", "test-openai-key")
+os.environ.setdefault("SUPABASE_URL", "http://supabase.test")
+os.environ.setdefault("SUPABASE_SERVICE_ROLE_KEY", "test-service-key")
+os.environ.setdefault("ADMIN_TOKEN", "test-admin-token")
+
+import pytest
+from fastapi.testclient import TestClient
+from sse_starlette.sse import AppStatus
+
+from app import main
+
+
+@pytest.fixture
+def client():
+    """Test client for the app (startup hooks are not run)"""
+    # sse-starlette binds its shutdown event to the first loop that uses it
+    AppStatus.should_exit_event = None
+    return TestClient(main.app)
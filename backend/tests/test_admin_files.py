@@ -0,0 +1,31 @@
+"""
+Tests for the admin file listing routes
+"""
+import pytest
+
+from app import main
+
+USER_ID = "22222222-2222-2222-2222-222222222222"
+
+ADMIN_FILE_ROUTES = [
+    f"/v1/admin/users/{USER_ID}/files?sign=1",
+    "/v1/admin/files?sign=1",
+]
+
+
+def _no_supabase():
+    raise AssertionError("admin route reached the database without a valid key")
+
+
+@pytest.mark.parametrize("path", ADMIN_FILE_ROUTES)
+def test_admin_files_require_key(client, monkeypatch, path):
+    monkeypatch.setattr(main, "get_supabase", _no_supabase)
+    response = client.get(path)
+    assert response.status_code == 403
+
+
+@pytest.mark.parametrize("path", ADMIN_FILE_ROUTES)
+def test_admin_files_reject_wrong_key(client, monkeypatch, path):
+    monkeypatch.setattr(main, "get_supabase", _no_supabase)
+    response = client.get(path, headers={"X-Admin-Key": "wrong"})
+    assert response.status_code == 403
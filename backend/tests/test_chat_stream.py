@@ -0,0 +1,49 @@
+"""
+Tests for the chat message SSE stream
+"""
+from app import main
+from app.llm_providers import StreamDelta, DONE_DELTA
+
+CHAT_ID = "11111111-1111-1111-1111-111111111111"
+USER_ID = "22222222-2222-2222-2222-222222222222"
+
+
+class FakeSupabase:
+    """Records message writes; returns an existing chat with no history"""
+
+    def __init__(self):
+        self.messages = []
+
+    def get_chat(self, chat_id):
+        return {"id": chat_id, "user_id": USER_ID}
+
+    def get_chat_messages(self, chat_id, limit=100, **kwargs):
+        return []
+
+    def create_message(self, chat_id, role, content, **kwargs):
+        self.messages.append({"role": role, "content": content})
+        return self.messages[-1]
+
+
+def test_send_message_streams_reply(client, monkeypatch):
+    supabase = FakeSupabase()
+
+    async def fake_openai_stream(messages, **kwargs):
+        yield StreamDelta(content="Hello")
+        yield StreamDelta(content=" there")
+        yield DONE_DELTA
+
+    monkeypatch.setattr(main, "get_supabase", lambda: supabase)
+    monkeypatch.setattr(main, "openai_stream", fake_openai_stream)
+
+    with client.stream(
+        "POST",
+        f"/v1/chats/{CHAT_ID}/message",
+        json={"message": "Hi", "user_id": USER_ID}
+    ) as response:
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+        body = "".join(response.iter_text())
+
+    assert "Hello" in body
+    assert "[DONE]" in body
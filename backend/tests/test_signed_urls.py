@@ -0,0 +1,29 @@
+"""
+Tests for batch signing of storage download URLs
+"""
+import httpx
+
+from app.supabase_client import SupabaseClient
+
+STORAGE_URL = "http://supabase.test/storage/v1"
+
+
+def make_client(handler) -> SupabaseClient:
+    """SupabaseClient whose Storage calls are answered by handler"""
+    client = SupabaseClient.__new__(SupabaseClient)
+    client._storage_url = STORAGE_URL
+    client._storage_http = httpx.Client(transport=httpx.MockTransport(handler))
+    return client
+
+
+def test_signed_urls_skip_missing_objects():
+    def handler(request: httpx.Request) -> httpx.Response:
+        assert request.url.path == "/storage/v1/object/sign/legal-docs"
+        return httpx.Response(200, json=[
+            {"path": "u/a.pdf", "signedURL": "/object/sign/legal-docs/u/a.pdf?token=a", "error": None},
+            {"path": "u/missing.pdf", "signedURL": None, "error": "Either the object does not exist or you do not have access to it"},
+        ])
+
+    urls = make_client(handler).get_signed_download_urls("legal-docs", ["u/a.pdf", "u/missing.pdf"])
+
+    assert urls == {"u/a.pdf": f"{STORAGE_URL}/object/sign/legal-docs/u/a.pdf?token=a"}
@@ -101,7 +101,7 @@ export default function AdminDashboard() {
   const handleDownloadFile = async (file: File) => {
     try {
       // Get download URL from backend
-      const response = await fetch(`${API_URL}/v1/files/${file.id}`, {
+      const response = await fetch(`${API_URL}/v1/files/${file.id}?sign=1`, {
         headers: { 'X-Admin-Key': ADMIN_KEY }
       })
       
@@ -127,7 +127,7 @@ export default function AdminDashboard() {
       console.log('Viewing file:', file.id, file.filename)
       
       // Get download URL from backend
-      const response = await fetch(`${API_URL}/v1/files/${file.id}`, {
+      const response = await fetch(`${API_URL}/v1/files/${file.id}?sign=1`, {
         headers: { 'X-Admin-Key': ADMIN_KEY }
       })
       
@@ -206,19 +206,13 @@ export default function AdminDashboard() {
     setChatMessages([])
     
     try {
-      // Load user's chats
-      const chatsRes = await fetch(`${API_URL}/v1/admin/users/${user.id}/chats`, {
+      // Load user's chats and files in one request
+      const dashboardRes = await fetch(`${API_URL}/v1/admin/users/${user.id}/dashboard`, {
         headers: { 'X-Admin-Key': ADMIN_KEY }
       })
-      const chatsData = await chatsRes.json()
-      setUserChats(chatsData.chats)
-
-      // Load user's files
-      const filesRes = await fetch(`${API_URL}/v1/admin/users/${user.id}/files`, {
-        headers: { 'X-Admin-Key': ADMIN_KEY }
-      })
-      const filesData = await filesRes.json()
-      setUserFiles(filesData.files)
+      const dashboardData = await dashboardRes.json()
+      setUserChats(dashboardData.chats)
+      setUserFiles(dashboardData.files)
     } catch (error) {
       console.error('Failed to load user details:', error)
     }
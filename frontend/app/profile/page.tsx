@@ -280,7 +280,7 @@ export default function ProfilePage() {
     try {
       // Use backend endpoint to get signed download URL
       const API_URL = process.env.NEXT_PUBLIC_API_URL || 'http://localhost:8080'
-      const response = await fetch(`${API_URL}/v1/files/${file.id}`, {
+      const response = await fetch(`${API_URL}/v1/files/${file.id}?sign=1`, {
         method: 'GET',
       })
 
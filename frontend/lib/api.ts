@@ -36,9 +36,13 @@ export async function createChat(userId: string, title?: string): Promise<Chat>
   return response.json()
 }
 
-// Get chat messages
-export async function getChatMessages(chatId: string): Promise<Message[]> {
-  const response = await fetch(`${API_URL}/v1/chats/${chatId}/messages`)
+// Get chat messages (pass the newest created_at you have to fetch only newer ones)
+export async function getChatMessages(chatId: string, after?: string): Promise<Message[]> {
+  const url = new URL(`${API_URL}/v1/chats/${chatId}/messages`)
+  if (after) {
+    url.searchParams.append('after', after)
+  }
+  const response = await fetch(url.toString())
   if (!response.ok) throw new Error('Failed to fetch messages')
   const data = await response.json()
   return data.messages
@@ -96,17 +100,19 @@ export async function* streamChatMessage(
           // Skip empty data
           if (!data) continue
           
+          let parsed
           try {
-            const parsed = JSON.parse(data)
-            if (parsed.content) {
-              yield parsed.content
-            }
-            if (parsed.error) {
-              throw new Error(parsed.error)
-            }
+            parsed = JSON.parse(data)
           } catch (e) {
             // Silently skip parse errors for incomplete chunks
             // They will be completed in the next iteration
+            continue
+          }
+          if (parsed.content) {
+            yield parsed.content
+          }
+          if (parsed.error) {
+            throw new Error(parsed.error)
           }
         }
       }